@@ -1,44 +1,100 @@
-# Metadata reader
-from mutagen.easyid3 import EasyID3
-from mutagen.wave import WAVE
-from mutagen.mp3 import MP3
+# Startup timing report
+import time
+STARTED = time.perf_counter()
 
 # Get music covers
 from PIL import Image, ImageTk, ImageDraw
-from mutagen.id3 import ID3, APIC
-import io
 
 # Graphic interface and file manipulation
-from tkinter import ttk, DoubleVar
+from tkinter import ttk
 from tkinter import filedialog
-from os import listdir, path
-from random import shuffle
-from os.path import join
+from os import path
 import tkinter as tk
 import pygame.mixer
 import webbrowser
 
-# Audio processing
-from tools.equalizer.audio_processor import AudioProcessor
+# Audio processing (the NumPy/SciPy parts are imported by load_dsp() when first needed)
 from tools.equalizer.equalizer import Eq
 
+# Timing metrics
+from tools.metrics import metrics
+from tools.paths import get_data_dir
+
+# Music library
+from tools.library.library_index import LibraryIndex
+from tools.library.scanner import FolderScanner, LoudnessScanner
+from tools.library.tags import read_track_info
+from tools.library.covers import CoverCache
+from tools.library.mp3_frames import FileSlice, frame_indexes
+
+# Playlist
+from tools.playlist.playlist_view import PlaylistView
+from tools.playlist.track_store import Track, TrackStore
+from tools.playlist.session import SessionStore
+from tools.playlist.shuffle import ShuffleOrder
+
+# Visualizer (the waveform analysis and the spectrum are imported when first needed)
+from tools.visualizer.waveform_bar import WaveformBar
+
 # System tray
 from threading import Thread
 import pystray
 
+SESSION_SAVE_INTERVAL = 30000  # ms between periodic session saves
+REVALIDATE_DELAY = 3000  # ms after startup before the restored playlist is checked against its folder
+END_CHECK_LEAD = 2000  # ms before the expected end of a song played by pygame.mixer.music to start watching for it
+END_CHECK_INTERVAL = 250  # ms between checks from then on
+STREAM_EVENT_INTERVAL = 50  # ms between checks for track changes and ends reported by the stream player
+
+class ScrollTicker:
+    """One timer that drives every ScrollingText.
+
+    It only runs while some text is scrolling and the window is visible; a
+    hidden or minimized window stops it until wake() is called again.
+    """
+    def __init__(self, widget, interval=150):
+        self.widget = widget
+        self.interval = interval
+        self.texts = []
+        self.job = None
+
+    def add(self, scrolling_text):
+        self.texts.append(scrolling_text)
+
+    def wake(self):
+        """Start ticking if something needs to scroll"""
+        if self.job is None and any(text.is_scrolling for text in self.texts) and self.widget.winfo_viewable():
+            self.job = self.widget.after(self.interval, self._tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+
+    def _tick(self):
+        self.job = None
+        if not self.widget.winfo_viewable():
+            return
+        for text in self.texts:
+            if text.is_scrolling:
+                text.step()
+        self.wake()
+
 class ScrollingText:
     """Class for creating scrolling text in labels"""
     
-    def __init__(self, label_widget, max_width=25, scroll_speed=150):
+    def __init__(self, label_widget, max_width=25, scroll_speed=150, ticker=None):
         self.label = label_widget
         self.max_width = max_width
-        self.scroll_speed = scroll_speed
         self.original_text = ""
+        self.shown_text = None
         self.current_position = 0
         self.is_scrolling = False
-        self.scroll_job = None
         self.pause_counter = 0
         self.pause_duration = 10
+        # Labels sharing a ticker scroll together on a single timer
+        self.ticker = ticker or ScrollTicker(label_widget, scroll_speed)
+        self.ticker.add(self)
         
     def set_text(self, text):
         """Sets the text and starts scrolling if necessary"""
@@ -46,21 +102,17 @@ class ScrollingText:
         self.current_position = 0
         self.pause_counter = 0
         
-        # Stop previous scroll if running
-        if self.scroll_job:
-            self.label.after_cancel(self.scroll_job)
-            self.scroll_job = None
-        
         # If the text fits the maximum width, it just displays
         if len(text) <= self.max_width:
-            self.label.config(text=text)
+            self._show(text)
             self.is_scrolling = False
         else:
             self.is_scrolling = True
-            self._scroll_text()
+            self.step()
+            self.ticker.wake()
     
-    def _scroll_text(self):
-        """Internal function that scrolls the text"""
+    def step(self):
+        """Moves the text one character, called by the ticker"""
         if not self.is_scrolling or not self.original_text:
             return
         
@@ -71,9 +123,7 @@ class ScrollingText:
             if self.pause_counter < self.pause_duration:
                 self.pause_counter += 1
                 # Show text from beginning while paused
-                visible_text = text[:self.max_width]
-                self.label.config(text=visible_text)
-                self.scroll_job = self.label.after(self.scroll_speed, self._scroll_text)
+                self._show(text[:self.max_width])
                 return
             else:
                 self.current_position = 0
@@ -93,17 +143,17 @@ class ScrollingText:
             self.current_position = 0
             visible_text = text[:self.max_width]
     
-        self.label.config(text=visible_text)
+        self._show(visible_text)
         self.current_position += 1
-        
-        # Schedule next scroll
-        self.scroll_job = self.label.after(self.scroll_speed, self._scroll_text)
     
     def stop_scrolling(self):
         self.is_scrolling = False
-        if self.scroll_job:
-            self.label.after_cancel(self.scroll_job)
-            self.scroll_job = None
+
+    def _show(self, visible_text):
+        # Only touch the label when what it shows changes
+        if visible_text != self.shown_text:
+            self.label.config(text=visible_text)
+            self.shown_text = visible_text
 
 def create_frutiger_button_image(width:int=40, height:int=40):
     """Creates a frutiger style to use as button background"""
@@ -127,17 +177,15 @@ def create_frutiger_button_image(width:int=40, height:int=40):
     return img
 
 def update_playlist_box(playing_idx=None):
-    """Updates the playlist widget with emoji on the playing music"""
-    
-    playlist_box.config(state="normal")
-    playlist_box.delete("1.0", tk.END)
-    
-    for idx, item in enumerate(playlist):
-        tag = "bg_red" if idx % 2 == 0 else "bg_darkred"
-        prefix = "▶️ " if playing_idx is not None and idx == playing_idx else ""
-        playlist_box.insert(tk.END, f"{prefix}{idx} - {item['nome']}\n", tag)
-    
-    playlist_box.config(state="disabled")
+    """Redraws the visible rows of the playlist with emoji on the playing music"""
+    playlist_view.playing_idx = playing_idx
+    playlist_view.refresh()
+
+def get_track_duration(item:Track):
+    """Returns the track length in seconds, reading it from the file only the first time"""
+    if item.duration is None:
+        item.duration = read_track_info(item.path)['duration']
+    return item.duration
 
 def time_formatting(seconds:int):
     minutes = seconds // 60
@@ -145,38 +193,25 @@ def time_formatting(seconds:int):
 
     return f"{minutes:02d}:{seconds:02d}"
 
-def get_cover(mp3_path:str):
-    """Returns a PIL.Image object of the MP3 cover, or None if none exists"""
-    try:
-        audio = MP3(mp3_path, ID3=ID3)
-        for tag in audio.tags.values():
-            if isinstance(tag, APIC):
-                image = Image.open(io.BytesIO(tag.data))
-                return image
-    except Exception:
-        return None
-    
 def update_cover(right_frame:ttk.Frame, default_image:ImageTk.PhotoImage, current_index:int):
+    """Shows the cover of the track in the cover label, creating the label on first use"""
+    global label_cover
     try:
-        music_path = playlist[current_index]['caminho']
-        image = get_cover(music_path)
-    except:
-        image = False
-
-    for widget in right_frame.grid_slaves(row=1, column=1):
-        widget.destroy()
-
-    if image:
-        image = image.resize((120, 120))
-        image_tk = ImageTk.PhotoImage(image)
-        label_cover = tk.Label(right_frame, image=image_tk, bg="#5A262C", borderwidth=0, highlightthickness=0)
-        label_cover.image = image_tk
-        label_cover.grid(row=1, column=1, padx=10)
-    else:
-        label_cover = tk.Label(right_frame, image=default_image, bg="#5A262C", borderwidth=0, highlightthickness=0)
-        label_cover.image = default_image
+        item = playlist[current_index]
+        image_tk = cover_cache.get_photo(item.path, item.has_cover)
+    except Exception:
+        image_tk = None
+
+    if image_tk is None:
+        image_tk = default_image
+
+    if label_cover is None:
+        label_cover = tk.Label(right_frame, bg="#5A262C", borderwidth=0, highlightthickness=0)
         label_cover.grid(row=1, column=1, padx=10)
 
+    label_cover.config(image=image_tk)
+    label_cover.image = image_tk
+
 class SystemTrayHandler:
     """Class to manage the system tray"""
     def __init__(self, root_window):
@@ -248,6 +283,9 @@ class SystemTrayHandler:
 
 def main():
     """App's main function"""
+    imports_seconds = time.perf_counter() - STARTED
+    metrics.record('startup.imports', imports_seconds)
+    startup_reported = False
     pygame.mixer.init() # pygame.mixer is not the best option and will be changed later.
 
     root = tk.Tk()
@@ -256,23 +294,103 @@ def main():
     root.iconbitmap("StarfruitMusicPlayer_Ico.ico")
 
     global playlist
-    playlist = []
+    playlist = TrackStore()
     current_index = 0
     is_paused = False
+    end_check_job = None  # timer for the end of a song played by pygame.mixer.music
+    position_job = None  # timer of the position display
+    position_offset = 0  # ms; pygame.mixer.music.get_pos() counts from where play() started
+    music_path = None  # file loaded in pygame.mixer.music
+    resume_position = 0.0  # seconds into the current song where the next play starts, from the last session
+    library_folder = None  # folder the playlist was loaded from
+    shuffle_order = None  # ShuffleOrder while shuffle is on; the playlist itself is never reordered
+    waveform_loader = None  # WaveformLoader, created for the first song shown
+    waveform_path = None  # song whose overview the seek bar shows or waits for
+    waveform_result = None  # (path, peaks) handed over by the loader thread
+    spectrum_display = None  # SpectrumDisplay, created when the spectrum is first turned on
     
     global tray_handler
     tray_handler = SystemTrayHandler(root)
     
-    audio_processor = AudioProcessor()
-    eq = Eq()
-    eq.audio_processor = audio_processor
+    # Created by load_dsp() once the EQ or gapless playback is first used
+    audio_processor = None
+    stream_player = None
+    prefetcher = None
+
+    def load_dsp():
+        """Imports the DSP stack and creates the audio processor, stream player and prefetcher, once"""
+        nonlocal audio_processor, stream_player, prefetcher
+        if audio_processor is None:
+            started = time.perf_counter()
+            from tools.equalizer.audio_processor import AudioProcessor
+            from tools.equalizer.stream_player import StreamPlayer
+            from tools.equalizer.prefetch import Prefetcher
+
+            # Also cleans the temp folder of files left by older versions
+            audio_processor = AudioProcessor()
+            stream_player = StreamPlayer(audio_processor)
+            stream_player.on_track_change = lambda: on_stream_track_change()
+            stream_player.on_end = lambda: on_track_end()
+            # Its worker only queues them, so it never waits on the Tk thread
+            poll_stream_events()
+            prefetcher = Prefetcher(audio_processor)
+            eq.audio_processor = audio_processor
+            set_crossfade()
+            set_volume(volume_var.get())
+
+            elapsed = time.perf_counter() - started
+            metrics.record('startup.dsp_load', elapsed)
+            print(f"DSP stack loaded in {elapsed * 1000:.0f} ms")
+        return audio_processor
+
+    def poll_stream_events():
+        stream_player.dispatch_events()
+        root.after(STREAM_EVENT_INTERVAL, poll_stream_events)
+
+    def cancel_prefetch():
+        if prefetcher is not None:
+            prefetcher.cancel()
+
+    eq = Eq(audio_processor_factory=load_dsp)
+
+    # Output currently in use: pygame.mixer.music, or the stream player for the EQ and gapless playback
+    player = pygame.mixer.music
+    library = LibraryIndex()
+    session = SessionStore()
+    scanner = FolderScanner(library)
+    scan_positions = {}  # playlist path -> index, while a folder scan fills the playlist
+    loudness_scanner = LoudnessScanner(library)
+    loudness_tracks = {}  # path -> Track waiting for its loudness measurement
+    album_levels = {}  # (folder, album) -> (loudness, true peak)
     
     def on_eq_change(gains):
         """Callback called when equalizer settings change"""
-        print(f"Equalizer updated: Bass={gains[0]:.1f}, Mid={gains[1]:.1f}, Treble={gains[2]:.1f}")
+        with metrics.span('eq.settings_change'):
+            apply_eq_change(gains)
+
+    def apply_eq_change(gains):
+        nonlocal resume_position
+        print(f"Equalizer updated: {', '.join(f'{gain:.1f}' for gain in gains)}")
+
+        # The stream player reads the gains block by block, so no restart is needed
+        if (
+            player is stream_player
+            and stream_player.get_busy()
+            and playlist and stream_player.input_file == playlist[current_index].path
+            and (eq.enabled or streaming())
+        ):
+            stream_player.set_equalize(eq.enabled)
+            queue_upcoming()
+            prefetch_next()
+            return
 
         if playlist and 0 <= current_index < len(playlist):
-            pygame.mixer.music.stop()
+            # A cached render of the old settings, or the file without EQ: carry on from the same spot,
+            # streaming the source with the new settings unless they are already rendered
+            if player.get_busy() or is_paused:
+                resume_position = max(get_position_ms(), 0) / 1000
+            player.stop()
+            metrics.begin('player.time_to_first_audio')
             play_music_w_eq()
     eq.set_callback(on_eq_change)
 
@@ -293,13 +411,6 @@ def main():
             background=[("active", "#5A262C"), ("selected", "#5A262C")],
             foreground=[("active", "#FFFFFF"), ("selected", "#FFFFFF")]
             )
-    style.configure("progressbar_default.Horizontal.TProgressbar",
-        troughcolor="#321316",
-        background="#e58015",
-        bordercolor="#5A262C",
-        lightcolor="#321316",
-        darkcolor="#321316"
-    )
     style.configure("default_scale.Horizontal.TScale")
 
     def create_frames():
@@ -353,9 +464,10 @@ def main():
     
     # Scrolling texts
     global scrolling_music, scrolling_artist, scrolling_album
-    scrolling_music = ScrollingText(music_name, max_width=25, scroll_speed=150)
-    scrolling_artist = ScrollingText(artist_name, max_width=25, scroll_speed=150)
-    scrolling_album = ScrollingText(album_name, max_width=25, scroll_speed=150)
+    scroll_ticker = ScrollTicker(root, interval=150)
+    scrolling_music = ScrollingText(music_name, max_width=25, ticker=scroll_ticker)
+    scrolling_artist = ScrollingText(artist_name, max_width=25, ticker=scroll_ticker)
+    scrolling_album = ScrollingText(album_name, max_width=25, ticker=scroll_ticker)
 
     # Timestamps
     global label_duration, label_total_duration
@@ -365,28 +477,27 @@ def main():
     label_total_duration = ttk.Label(frames["right"], text="00:00", font=normal, style="texto_default.TLabel")
     label_total_duration.grid(row=4, column=2)
 
-    # Progressbar
-    progress_var = DoubleVar()
-    progress_bar = ttk.Progressbar(
-        frames["right"],
-        variable=progress_var,
-        maximum=100,
-        mode='determinate',
-        style='progressbar_default.Horizontal.TProgressbar'
-    )
-    progress_bar.grid(row=4, column=1, padx=5, pady=5, sticky='ew')
+    # Progress bar, drawn as the waveform of the song
+    progress_bar = WaveformBar(frames["right"], width=200, height=32)
+    progress_bar.grid(row=4, column=1, padx=5, pady=5)
+    progress_bar.config(cursor="hand2")
+    progress_bar.bind("<Button-1>", lambda event: on_progress_click(event))
 
     # Playlist
     label = ttk.Label(frames["left"], text="Playlist", font=strong, style="texto_default.TLabel")
     label.grid(row=0, column=0, padx=10, pady=10)
 
-    global playlist_box
-    playlist_box = tk.Text(frames["left"], height=16, width=40, background="#321316")
-    playlist_box.grid(row=1, column=0, padx=5, pady=5)
-    playlist_box.config(state="disabled")
-
-    playlist_box.tag_configure("bg_red", background="#f09696")
-    playlist_box.tag_configure("bg_darkred", background="#e27e7e")
+    global playlist_view
+    playlist_view = PlaylistView(
+        frames["left"],
+        count=lambda: len(playlist),
+        label_for=lambda idx: f"{idx} - {playlist[idx].name}",
+        on_activate=lambda idx: play_track(idx),
+        rows=16,
+        width=40,
+        background="#321316"
+    )
+    playlist_view.grid(row=1, column=0, padx=5, pady=5)
 
     # Buttons
     frutiger_img = create_frutiger_button_image()
@@ -451,7 +562,7 @@ def main():
         compound="center",
         fg="white",
         bg="#5A262C",
-        command=lambda:play_music("><"),
+        command=lambda:toggle_shuffle(),
         font=normal,
         bd=0,
         highlightthickness=0,
@@ -467,16 +578,126 @@ def main():
         frames["options"],
         text="Autoplay",
         variable=autoplay_var,
+        command=lambda:prefetch_next(),
         style="checkbox_default.TCheckbutton",
         cursor="hand2",
         takefocus=False)
     autoplay_checkbox.grid(row=0, column=0)
 
+    # Gapless playback and crossfade
+    gapless_var = tk.BooleanVar()
+    gapless_checkbox = ttk.Checkbutton(
+        frames["options"],
+        text="Gapless",
+        variable=gapless_var,
+        command=lambda:queue_upcoming(),
+        style="checkbox_default.TCheckbutton",
+        cursor="hand2",
+        takefocus=False)
+    gapless_checkbox.grid(row=1, column=0)
+
+    crossfade_var = tk.DoubleVar(value=0)
+    def set_crossfade():
+        """Set the crossfade length between tracks in gapless mode"""
+        if stream_player is None:
+            return
+        try:
+            stream_player.crossfade_seconds = max(0.0, float(crossfade_var.get()))
+        except (tk.TclError, ValueError):
+            stream_player.crossfade_seconds = 0.0
+    crossfade_label = ttk.Label(frames["options"], text="Crossfade (s)", style="texto_default.TLabel")
+    crossfade_label.grid(row=1, column=1, columnspan=2, padx=5)
+    crossfade_spinbox = ttk.Spinbox(
+        frames["options"],
+        from_=0,
+        to=10,
+        increment=1,
+        width=3,
+        textvariable=crossfade_var,
+        command=set_crossfade)
+    crossfade_spinbox.bind("<FocusOut>", lambda event: set_crossfade())
+    crossfade_spinbox.grid(row=1, column=3, padx=5)
+
+    # Loudness normalization
+    normalize_var = tk.StringVar(value="Off")
+    normalize_label = ttk.Label(frames["options"], text="Normalize", style="texto_default.TLabel")
+    normalize_label.grid(row=2, column=0, padx=5)
+    normalize_combobox = ttk.Combobox(
+        frames["options"],
+        values=("Off", "Track", "Album"),
+        textvariable=normalize_var,
+        state="readonly",
+        width=6,
+        takefocus=False)
+    normalize_combobox.bind("<<ComboboxSelected>>", lambda event: on_normalize_change())
+    normalize_combobox.grid(row=2, column=1, columnspan=2, padx=5, sticky="w")
+
+    # Live spectrum
+    spectrum_var = tk.BooleanVar()
+    spectrum_checkbox = ttk.Checkbutton(
+        frames["options"],
+        text="Spectrum",
+        variable=spectrum_var,
+        command=lambda:on_spectrum_change(),
+        style="checkbox_default.TCheckbutton",
+        cursor="hand2",
+        takefocus=False)
+    spectrum_checkbox.grid(row=3, column=0)
+
+    def streaming():
+        """True when every song must go through the stream player: gapless playback and the spectrum need it"""
+        return gapless_var.get() or spectrum_var.get()
+
+    def on_spectrum_change():
+        """Shows or hides the spectrum. It reads the stream player's samples, so a playing song moves over to it"""
+        nonlocal spectrum_display, resume_position
+        if not spectrum_var.get():
+            if spectrum_display is not None:
+                spectrum_display.stop()
+                spectrum_display.view.grid_remove()
+            return
+
+        if spectrum_display is None:
+            from tools.visualizer.spectrum import SpectrumDisplay, SpectrumView
+            view = SpectrumView(frames["right"], width=200, height=40)
+            spectrum_display = SpectrumDisplay(view, read_spectrum_frames, pygame.mixer.get_init()[0])
+        spectrum_display.view.grid(row=5, column=1, padx=5, pady=5)
+        spectrum_display.start()
+
+        if player is pygame.mixer.music and player.get_busy() and not is_paused:
+            # Carry on from the same position
+            resume_position = max(get_position_ms(), 0) / 1000
+            play_music_w_eq()
+
+    def read_spectrum_frames(count):
+        return stream_player.get_playing_frames(count) if player is stream_player else None
+
+    def gain_for(item:Track):
+        """Loudness normalization gain for a track, following the Normalize option"""
+        mode = normalize_var.get()
+        if mode == "Off":
+            return 1.0
+
+        from tools.library.loudness import track_gain, album_loudness
+        if mode == "Album":
+            key = (item.folder, item.album)
+            if key not in album_levels:
+                album_levels[key] = album_loudness(track for track in playlist if track.folder == item.folder and track.album == item.album)
+            loudness, true_peak = album_levels[key]
+            if loudness is not None:
+                return track_gain(loudness, true_peak)
+        return track_gain(item.loudness, item.true_peak)
+
     # Volume slider
     volume_var = tk.DoubleVar(value=0.5)
     def set_volume(val):
-        """Set pygame.music volume"""
-        pygame.mixer.music.set_volume(float(val))
+        """Set the volume of both players, with the normalization gain of the current song"""
+        gain = gain_for(playlist[current_index]) if playlist and 0 <= current_index < len(playlist) else 1.0
+        # pygame.mixer.music can only attenuate; the stream player applies the gain to the samples
+        pygame.mixer.music.set_volume(float(val) * min(gain, 1.0))
+        if stream_player is not None:
+            stream_player.set_volume(float(val))
+            stream_player.set_gain(gain)
     volume_slider = ttk.Scale(
         frames["options"],
         from_=0,
@@ -499,6 +720,9 @@ def main():
     # Cover
     default_image = Image.open("images/default_cover.png").resize((120, 120))
     default_image_tk = ImageTk.PhotoImage(default_image)
+    global cover_cache, label_cover
+    cover_cache = CoverCache(size=(120, 120))
+    label_cover = None
     update_cover(frames["right"], default_image_tk, current_index=0)
 
     # System tray
@@ -509,9 +733,17 @@ def main():
     
     def quit_app():
         """Function to exit the application completely"""
+        # Saved first, while the players still know the position
+        save_session()
         scrolling_music.stop_scrolling()
         scrolling_artist.stop_scrolling()
         scrolling_album.stop_scrolling()
+        scroll_ticker.stop()
+        if stream_player is not None:
+            stream_player.stop()
+        cancel_prefetch()
+        scanner.cancel()
+        loudness_scanner.cancel()
         
         tray_handler.stop_tray()
         root.quit()
@@ -531,6 +763,7 @@ def main():
 
         tools_menu_bar = tk.Menu(menu_bar, tearoff=0)
         tools_menu_bar.add_command(label="Equalizer", command=lambda:eq.open_window())
+        tools_menu_bar.add_command(label="Timing metrics", command=open_metrics_window)
         menu_bar.add_cascade(label="Tools", menu=tools_menu_bar)
 
         about_menu_bar = tk.Menu(menu_bar, tearoff=0)
@@ -538,99 +771,271 @@ def main():
         menu_bar.add_cascade(label="About", menu=about_menu_bar)
 
         root.config(menu=menu_bar)
+
+    def open_metrics_window():
+        """Debug panel with the timing spans collected so far, refreshed every second"""
+        window = tk.Toplevel(root)
+        window.title("Timing metrics")
+        text = tk.Text(window, width=80, height=24, font=("Courier", 9), background="#321316", foreground="#FFFFFF")
+        text.pack(fill=tk.BOTH, expand=True)
+        save_button = ttk.Button(window, text="Save JSON", command=lambda:save_metrics(show=True))
+        save_button.pack(pady=5)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            text.config(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, metrics.format())
+            text.config(state=tk.DISABLED)
+            window.after(1000, refresh)
+        refresh()
+
+    def save_metrics(show=False):
+        """Dumps the timing spans to metrics.json in the data folder"""
+        metrics_path = path.join(get_data_dir(), "metrics.json")
+        metrics.dump(metrics_path)
+        if show:
+            label_log.config(text=f"Metrics saved to {metrics_path}")
+
     create_menus()
 
     def play_music_w_eq():
         """Plays the current song applying equalization"""
+        nonlocal player
+        nonlocal is_paused
+        nonlocal position_offset, resume_position
+        nonlocal music_path
+
         if playlist and 0 <= current_index < len(playlist):
-            original_path = playlist[current_index]['caminho']
+            original_path = playlist[current_index].path
+            get_track_duration(playlist[current_index])
+            start, resume_position = resume_position, 0.0
+            position_offset = 0
             
             try:
-                # Check if equalizer is active and process accordingly
-                if eq.enabled:
-                    processed_path = eq.process_current_track(original_path)
-                    # Check if processing was successful
-                    if processed_path != original_path and path.exists(processed_path):
-                        pygame.mixer.music.load(processed_path)
-                        print(f"Playing with equalization: {path.basename(original_path)}")
+                player.stop()
+                if eq.enabled or streaming():
+                    load_dsp()
+
+                # Check if equalizer is active: play a cached render, or stream through it
+                cached_path = (audio_processor.get_cached_render(original_path)
+                               if eq.enabled and not audio_processor.is_flat() else None)
+                gain = gain_for(playlist[current_index])
+                with metrics.span('player.load'):
+                    if streaming():
+                        # Everything goes through the stream player, so the next track can be spliced on
+                        # and the spectrum sees the samples
+                        player = stream_player
+                        player.load(cached_path or original_path, equalize=eq.enabled and not cached_path, gain=gain)
+                        print(f"Streaming: {path.basename(original_path)}")
+                    elif cached_path:
+                        player = pygame.mixer.music
+                        music_path = cached_path
+                        player.load(cached_path)
+                        print(f"Playing with equalization (cached): {path.basename(original_path)}")
+                    elif eq.enabled:
+                        player = stream_player
+                        player.load(original_path, gain=gain)
+                        print(f"Streaming with equalization: {path.basename(original_path)}")
                     else:
-                        pygame.mixer.music.load(original_path)
-                        print(f"Playing without equalization (File not processed): {path.basename(original_path)}")
-                else:
-                    # Equalizer disabled - load original file directly
-                    pygame.mixer.music.load(original_path)
-                    print(f"Playing the original file (EQ disabled): {path.basename(original_path)}")
+                        player = pygame.mixer.music
+                        music_path = original_path
+                        player.load(original_path)
+                        print(f"Playing the original file (EQ disabled): {path.basename(original_path)}")
                 
-                pygame.mixer.music.play()
+                set_volume(volume_var.get())
+                with metrics.span('player.play'):
+                    if player is pygame.mixer.music and start:
+                        position_offset = int(seek_music(start) * 1000)
+                    else:
+                        player.play(0, start)
+                # So the first seek in a long MP3 does not have to wait for its frame index
+                frame_indexes.prepare(original_path)
+                # The stream player closes the span when its first block reaches the mixer
+                if player is pygame.mixer.music:
+                    metrics.end('player.time_to_first_audio')
                 play_button.config(text="||")
                 is_paused = False
                 
             except Exception as e:
                 print(f"An error has occurred: {e}")
                 try:
-                    pygame.mixer.music.load(original_path)
-                    pygame.mixer.music.play()
+                    if stream_player is not None:
+                        stream_player.stop()
+                    player = pygame.mixer.music
+                    music_path = original_path
+                    player.load(original_path)
+                    player.play()
+                    metrics.end('player.time_to_first_audio')
                     play_button.config(text="||")
                     is_paused = False
                     print(f"Playing original file: {path.basename(original_path)}")
                 except Exception as e2:
                     print(f"Fatal error: {e2}")
+                    metrics.cancel('player.time_to_first_audio')
                     play_button.config(text=">")
 
+            queue_upcoming()
+            prefetch_next()
+            schedule_end_check()
+            update_position()
+
+    def queue_upcoming():
+        """In gapless mode, hands the next song to the stream player so it is decoded ahead"""
+        if player is stream_player and gapless_var.get() and autoplay_var.get() and len(playlist) > 1:
+            next_item = playlist[upcoming_index()]
+            next_path = next_item.path
+            cached_path = audio_processor.get_cached_render(next_path) if eq.enabled else None
+            stream_player.queue_next(cached_path or next_path, equalize=eq.enabled and not cached_path, tag=next_path,
+                                     gain=gain_for(next_item))
+        elif stream_player is not None:
+            stream_player.queue_next(None)
+
+    def show_track_info():
+        """Shows the names, cover and playlist marker of the current song"""
+        with metrics.span('ui.track_info'):
+            update_track_info()
+
+    def update_track_info(cover=True):
+        scrolling_music.set_text(playlist[current_index].name)
+        scrolling_artist.set_text(f"Artist: {playlist[current_index].artist}")
+        scrolling_album.set_text(f"Album: {playlist[current_index].album}")
+        playlist_view.set_playing(current_index)
+        if cover:
+            update_cover(frames["right"], default_image_tk, current_index)
+            show_waveform()
+
+    def show_waveform():
+        """Draws the overview of the current song on the seek bar; it is loaded or computed in the background"""
+        nonlocal waveform_loader, waveform_path
+        track_path = playlist[current_index].path
+        if track_path == waveform_path:
+            return
+        waveform_path = track_path
+        progress_bar.set_peaks(None)
+        if waveform_loader is None:
+            from tools.library.waveform import WaveformLoader
+            waveform_loader = WaveformLoader(on_waveform_loaded)
+        waveform_loader.request(track_path)
+
+    def on_waveform_loaded(track_path, peaks):
+        # Loader thread: hand the peaks over to the Tk thread
+        nonlocal waveform_result
+        waveform_result = (track_path, peaks)
+        root.event_generate("<<WaveformReady>>", when="tail")
+
+    def on_waveform_ready():
+        if waveform_result is None:
+            return
+        track_path, peaks = waveform_result
+        # Skip overviews of songs that are no longer shown
+        if peaks is not None and track_path == waveform_path:
+            with metrics.span('ui.waveform_draw'):
+                progress_bar.set_peaks(peaks.tolist())
+
+    def prefetch_next():
+        """Pre-renders the next song with the equalizer while autoplay is on"""
+        if eq.enabled and autoplay_var.get() and len(playlist) > 1:
+            load_dsp()
+            # Flat settings play the source file as it is, so there is nothing to render
+            if not audio_processor.is_flat():
+                prefetcher.request(playlist[upcoming_index()].path)
+                return
+        cancel_prefetch()
+
+    def upcoming_index():
+        """Index of the song that plays after the current one, following the shuffle order when it is on"""
+        if shuffle_order is not None:
+            return shuffle_order.peek_next()
+        return (current_index + 1) % len(playlist)
+
+    def toggle_shuffle():
+        """Turns shuffle on or off; the playlist keeps its order and the current song keeps playing"""
+        nonlocal shuffle_order
+        if shuffle_order is None:
+            shuffle_order = ShuffleOrder(len(playlist), current_index if playlist else None)
+        else:
+            shuffle_order = None
+        show_shuffle_state()
+        # The next song is a different one now
+        queue_upcoming()
+        prefetch_next()
+
+    def show_shuffle_state():
+        random_button.config(fg="#e58015" if shuffle_order is not None else "white")
+
     def play_music(option:str):
         """Plays the song at the specified index in the playlist"""
         nonlocal current_index
         nonlocal is_paused
+        nonlocal resume_position
 
         # Handle play/pause first (without unloading music)
         if option == ">":
-            if pygame.mixer.music.get_busy() and not is_paused:
+            if player.get_busy() and not is_paused:
                 # Music is playing, so pause it
-                pygame.mixer.music.pause()
+                player.pause()
                 play_button.config(text=">")
                 is_paused = True
+                cancel_end_check()
+                update_position()
                 return
             elif is_paused:
                 # Music is paused, so unpause it
-                pygame.mixer.music.unpause()
+                player.unpause()
                 play_button.config(text="||")
                 is_paused = False
+                schedule_end_check()
+                update_position()
                 return
 
-        # For other operations (change tracks), unload and clear cache
-        pygame.mixer.music.unload()
-        audio_processor.clear_cache()
+        # For other operations (change tracks), unload the current one
+        if option != ">":
+            # Only resuming the restored song starts from the saved position
+            resume_position = 0.0
+        metrics.begin('player.time_to_first_audio')
+        cancel_end_check()
+        player.unload()
+        cancel_prefetch()
         
-        if option == "|<": current_index -= 1
-        elif option == ">|": current_index += 1
-        elif option == "><":
-            if playlist:
-                shuffle(playlist)
-                current_index = 0
-                play_music_w_eq()
-                update_playlist_box(playing_idx=current_index)
-                scrolling_music.set_text(playlist[current_index]['nome'])
-                scrolling_artist.set_text(f"Artist: {playlist[current_index]['artista']}")
-                scrolling_album.set_text(f"Album: {playlist[current_index]['album']}")
-                update_cover(frames["right"], default_image_tk, current_index)
-                return
+        # "=" plays the song at current_index as it is
+        if option == "|<":
+            if shuffle_order is None:
+                current_index -= 1
+            else:
+                # Back to the song that actually played before; at the start of the history, replay this one
+                previous_index = shuffle_order.previous()
+                if previous_index is not None:
+                    current_index = previous_index
+        elif option == ">|":
+            if shuffle_order is None:
+                current_index += 1
+            elif playlist:
+                current_index = shuffle_order.next()
 
         if playlist:
             if current_index < 0: current_index = 0
             elif current_index >= len(playlist): current_index = 0
 
-            play_music_w_eq()
-
-            scrolling_music.set_text(playlist[current_index]['nome'])
-            scrolling_artist.set_text(f"Artist: {playlist[current_index]['artista']}")
-            scrolling_album.set_text(f"Album: {playlist[current_index]['album']}")
+            if shuffle_order is not None and shuffle_order.position < 0:
+                # First song since shuffle was turned on with an empty playlist
+                shuffle_order.jump(current_index)
 
-            update_playlist_box(playing_idx=current_index)
-            update_cover(frames["right"], default_image_tk, current_index)
+            play_music_w_eq()
+            show_track_info()
 
             return True
         return False
     
+    def play_track(idx:int):
+        """Plays the song clicked in the playlist"""
+        nonlocal current_index
+        current_index = idx
+        if shuffle_order is not None:
+            shuffle_order.jump(idx)
+        play_music("=")
+
     tray_handler.next_track = lambda icon=None, item=None: play_music(">|")
     tray_handler.previous_track = lambda icon=None, item=None: play_music("|<")
     
@@ -640,104 +1045,389 @@ def main():
     def load_folder():
         """Load a folder and add music files to the playlist"""
         nonlocal current_index
+        nonlocal library_folder, resume_position
+        nonlocal shuffle_order
         current_index = 0
 
         folder = filedialog.askdirectory()
         if folder:
-            pygame.mixer.music.stop()
+            library_folder = folder
+            resume_position = 0.0
+            player.stop()
+            cancel_end_check()
+            cancel_prefetch()
+            loudness_scanner.cancel()
+            album_levels.clear()
             play_button.config(text=">")
-            playlist_box.config(state="normal")
-            playlist_box.delete("1.0", tk.END)
             playlist.clear()
 
-            for idx, item in enumerate(listdir(folder)):
-                item_lower = item.lower()
-                if item_lower.endswith('.mp3') or item_lower.endswith('.wav'):
-                    full_path = join(folder, item)
-                    artist = "Unknown"
-                    album = "Unknown"
-
-                    if item_lower.endswith('.mp3'):
-                        audio = MP3(full_path, ID3=EasyID3)
-                        artist = audio.get('artist', ['Unknown'])[0]
-                        album = audio.get('album', ['Unknown'])[0]
-
-                    elif item_lower.endswith('.wav'):
-                        audio = WAVE(full_path)
-                        artist = audio.get('artist', ['Unknown'])[0] if 'artist' in audio else "Unknown"
-                        album = audio.get('album', ['Unknown'])[0] if 'album' in audio else "Unknown"
-
-                    playlist.append({
-                        'nome': item[:-4],
-                        'caminho': full_path,
-                        'artista': artist,
-                        'album': album
-                    })
-                    
-                    tag = "bg_red" if idx % 2 == 0 else "bg_darkred"
-                    playlist_box.insert(tk.END, f"{idx} - {item[:-4]}\n", tag)
-                    
-            playlist_box.config(state="disabled")
+            # Show what the library index already knows; the scan brings it up to date in the background
+            playlist.extend(library.get_folder(folder))
+            if shuffle_order is not None:
+                shuffle_order = ShuffleOrder(len(playlist), current_index if playlist else None)
+            update_playlist_box()
+            scan_positions.clear()
+            scan_positions.update((item.path, idx) for idx, item in enumerate(playlist))
 
             if playlist:
                 play_music(">")
 
-    def check_music_end():
-        """Check if the song has finished, and if so, play the next one automatically, if the autoplay option is checked."""
+            label_log.config(text=f"Scanning {folder}...")
+            scanner.start(folder)
+            root.after(100, poll_scan)
+
+    def revalidate_playlist():
+        """Brings the restored playlist up to date with its folder; only new or changed files are read"""
+        if not library_folder or scanner.busy or not path.isdir(library_folder):
+            return
+        scan_positions.clear()
+        scan_positions.update((item.path, idx) for idx, item in enumerate(playlist))
+        label_log.config(text=f"Checking {library_folder} for changes...")
+        scanner.start(library_folder)
+        root.after(100, poll_scan)
+
+    def poll_scan():
+        """Moves the folder scan results into the playlist as they arrive"""
+        nonlocal current_index
+        nonlocal resume_position
+        nonlocal shuffle_order
+
+        for kind, entries, scanned, elapsed in scanner.poll():
+            rate = scanned / elapsed if elapsed > 0 else 0
+
+            if kind == 'batch':
+                first_new = len(playlist)
+                for entry in entries:
+                    idx = scan_positions.get(entry.path)
+                    if idx is None:
+                        scan_positions[entry.path] = len(playlist)
+                        playlist.append(entry)
+                    else:
+                        playlist[idx] = entry
+                if shuffle_order is not None:
+                    shuffle_order.grow(len(playlist))
+                playlist_view.refresh()
+
+                label_log.config(text=f"Scanning... {scanned} file(s), {rate:.0f} files/s")
+
+                # Start playing as soon as the first tracks are known
+                if first_new == 0 and playlist:
+                    play_music(">")
+
+            elif kind == 'done':
+                # Drop tracks that were in the index but are gone from the folder
+                if entries is not None and len(entries) != len(playlist):
+                    found = {entry.path for entry in entries}
+                    playing_path = playlist[current_index].path if 0 <= current_index < len(playlist) else None
+                    playlist.replace(item for item in playlist if item.path in found)
+                    current_index = next((idx for idx, item in enumerate(playlist) if item.path == playing_path), 0)
+                    if playing_path not in found:
+                        resume_position = 0.0
+                    # The indices moved, so the shuffle starts over from the current song
+                    if shuffle_order is not None:
+                        shuffle_order = ShuffleOrder(len(playlist), current_index)
+                    update_playlist_box(playing_idx=current_index if playing_path in found else None)
+
+                label_log.config(text=f"Loaded {len(playlist)} track(s) from {scanner.folder} in {elapsed:.1f}s ({rate:.0f} files/s)")
+                analyze_loudness()
+                return
+
+        if scanner.busy:
+            root.after(100, poll_scan)
+
+    def on_normalize_change():
+        """Applies the new Normalize option and measures the tracks it needs"""
+        set_volume(volume_var.get())
+        queue_upcoming()
+        # A folder scan in progress starts the analysis when it is done
+        if not scanner.busy:
+            analyze_loudness()
+
+    def analyze_loudness():
+        """Measures the loudness of the playlist tracks that have none yet, on a process pool"""
+        if normalize_var.get() == "Off":
+            return
+
+        loudness_tracks.clear()
+        loudness_tracks.update((item.path, item) for item in playlist if item.true_peak is None)
+        if loudness_tracks:
+            label_log.config(text=f"Analyzing loudness of {len(loudness_tracks)} track(s)...")
+            loudness_scanner.start(loudness_tracks)
+            root.after(500, poll_loudness)
+
+    def poll_loudness():
+        """Stores the loudness measurements in the playlist tracks as they arrive"""
+        for kind, results, measured, total, elapsed in loudness_scanner.poll():
+            rate = measured / elapsed if elapsed > 0 else 0
+
+            for track_path, loudness, true_peak in results:
+                item = loudness_tracks.pop(track_path, None)
+                if item is not None:
+                    item.loudness, item.true_peak = loudness, true_peak
+            if results:
+                album_levels.clear()
+                if playlist and 0 <= current_index < len(playlist) and playlist[current_index].path in {result[0] for result in results}:
+                    set_volume(volume_var.get())
+
+            if kind == 'batch':
+                label_log.config(text=f"Analyzing loudness... {measured}/{total} track(s), {rate:.1f} tracks/s")
+            elif kind == 'done':
+                label_log.config(text=f"Loudness analyzed for {measured} track(s) in {elapsed:.1f}s ({rate:.1f} tracks/s)")
+                return
+
+        if loudness_scanner.busy:
+            root.after(500, poll_loudness)
+
+    def on_stream_track_change():
+        """In gapless mode the stream player moves on by itself; follow it"""
+        nonlocal current_index
+
+        next_path = stream_player.pop_track_change() if stream_player is not None else None
+        if next_path is not None and playlist:
+            next_index = upcoming_index()
+            if playlist[next_index].path == next_path:
+                current_index = next_index
+                if shuffle_order is not None:
+                    shuffle_order.next()
+                set_volume(volume_var.get())
+                show_track_info()
+                queue_upcoming()
+                prefetch_next()
+                update_position()
+
+    def on_track_end():
+        """Plays the next song when the current one has finished, if the autoplay option is checked"""
+        update_position()
         if (
             autoplay_var.get()
             and playlist
             and not is_paused
-            and not pygame.mixer.music.get_busy()
+            and not player.get_busy()
         ):
             play_music(">|")
-                
-        root.after(500, check_music_end)
-    def music_stats():
-        """Gets the current status of the song"""
 
-        if playlist and 0 <= current_index < len(playlist):
-            path = playlist[current_index]['caminho']
+    def schedule_end_check():
+        """pygame.mixer.music has no end callback without a display, so wake up shortly before the song should be
+        over and check get_busy() a few times a second from then on"""
+        nonlocal end_check_job
+        cancel_end_check()
+        if player is not pygame.mixer.music or is_paused or not playlist:
+            return
 
-            pos_ms = pygame.mixer.music.get_pos()
-            pos_sec = max(0, pos_ms // 1000)
+        # The frame index gives the exact length of an MP3, where the tags may be off by seconds
+        index = frame_indexes.peek(music_path) if music_path.lower().endswith('.mp3') else None
+        duration = index.duration if index is not None else get_track_duration(playlist[current_index])
+        remaining_ms = duration * 1000 - max(get_position_ms(), 0) if duration > 0 else 0
+        delay = remaining_ms - END_CHECK_LEAD if remaining_ms > END_CHECK_LEAD else END_CHECK_INTERVAL
+        end_check_job = root.after(int(delay), check_mixer_end)
+
+    def check_mixer_end():
+        nonlocal end_check_job
+        end_check_job = None
+        if player is not pygame.mixer.music or is_paused:
+            return
+        if player.get_busy():
+            schedule_end_check()
+        else:
+            on_track_end()
 
-            if path.lower().endswith('.mp3'):
-                audio = MP3(path)
-                total_duration = int(audio.info.length)
+    def cancel_end_check():
+        nonlocal end_check_job
+        if end_check_job is not None:
+            root.after_cancel(end_check_job)
+            end_check_job = None
 
-            elif path.lower().endswith('.wav'):
-                audio = WAVE(path)
-                total_duration = int(audio.info.length)
+    def update_position():
+        """Shows the position of the song, and keeps doing so twice a second while it plays and the window is visible"""
+        nonlocal position_job
+        if position_job is not None:
+            root.after_cancel(position_job)
+            position_job = None
 
-            else:
-                total_duration = 0
+        if playlist and 0 <= current_index < len(playlist):
+            pos_ms = get_position_ms()
+            pos_sec = max(0, pos_ms // 1000)
+            duration = get_track_duration(playlist[current_index])
+            total_duration = int(duration)
 
             label_duration.config(text=time_formatting(pos_sec))
             label_total_duration.config(text=time_formatting(total_duration))
 
             # Update progress bar
-            if total_duration > 0:
-                progress = (pos_sec / total_duration) * 100
-                progress_var.set(progress)
+            if duration > 0:
+                progress_bar.set_progress(max(pos_ms, 0) / 1000 / duration)
+            else:
+                progress_bar.set_progress(0)
+
+        if player.get_busy() and not is_paused and root.winfo_viewable():
+            position_job = root.after(500, update_position)
+
+    def seek_music(seconds):
+        """Plays pygame.mixer.music from seconds into music_path; returns the position it actually starts at"""
+        if music_path.lower().endswith('.mp3'):
+            try:
+                offset, position = frame_indexes.get(music_path).seek_point(seconds)
+            except (OSError, ValueError) as e:
+                print(f"Could not index the frames of {path.basename(music_path)}: {e}")
+            else:
+                # Decoding from that frame on spares SDL_mixer its scan from the start of the file
+                pygame.mixer.music.load(FileSlice(music_path, offset), "mp3")
+                pygame.mixer.music.play()
+                return position
+        pygame.mixer.music.play(0, seconds)
+        return seconds
+
+    def on_progress_click(event):
+        """Click-to-seek on the progress bar"""
+        if playlist and 0 <= current_index < len(playlist):
+            fraction = event.x / max(progress_bar.winfo_width(), 1)
+            seek_to(fraction * get_track_duration(playlist[current_index]))
+
+    def seek_to(seconds):
+        """Moves the current song to seconds in; when nothing is playing, the next Play starts there"""
+        nonlocal position_offset, resume_position, is_paused
+        if not playlist or not 0 <= current_index < len(playlist):
+            return
+        duration = get_track_duration(playlist[current_index])
+        seconds = min(max(seconds, 0.0), max(duration - 1.0, 0.0))
+
+        if not player.get_busy() and not is_paused:
+            resume_position = seconds
+            update_position()
+            return
 
+        with metrics.span('player.seek'):
+            if player is pygame.mixer.music:
+                position_offset = int(seek_music(seconds) * 1000)
             else:
-                progress_var.set(0)
+                player.play(0, seconds)
+                queue_upcoming()
+        # Seeking while paused resumes playback
+        is_paused = False
+        play_button.config(text="||")
+        schedule_end_check()
+        update_position()
+
+    def get_position_ms():
+        """Position in the current song in milliseconds, or -1 if nothing is playing"""
+        if resume_position:
+            return int(resume_position * 1000)
+        pos_ms = player.get_pos()
+        if player is pygame.mixer.music and pos_ms >= 0:
+            pos_ms += position_offset
+        return pos_ms
+
+    def save_session():
+        """Writes the playlist, position and settings, so the next launch starts where this one stops"""
+        if player.get_busy() or is_paused:
+            position = max(get_position_ms(), 0) / 1000
+        else:
+            position = resume_position
+        try:
+            crossfade = float(crossfade_var.get())
+        except (tk.TclError, ValueError):
+            crossfade = 0.0
+
+        with metrics.span('session.save'):
+            session.save(playlist, {
+                'folder': library_folder,
+                'index': current_index,
+                'position': position,
+                'volume': volume_var.get(),
+                'autoplay': autoplay_var.get(),
+                'gapless': gapless_var.get(),
+                'crossfade': crossfade,
+                'normalize': normalize_var.get(),
+                'spectrum': spectrum_var.get(),
+                'eq': eq.get_settings(),
+                'shuffle': shuffle_order.get_state() if shuffle_order is not None else None,
+            })
+
+    def autosave_session():
+        save_session()
+        root.after(SESSION_SAVE_INTERVAL, autosave_session)
+
+    def restore_session():
+        """Puts back the last session straight from the snapshot; the files are only checked later, in the background"""
+        nonlocal current_index, resume_position, library_folder
+        nonlocal shuffle_order
+        with metrics.span('session.restore'):
+            tracks, state = session.load()
+            if not state:
+                return
 
-        root.after(500, music_stats)
+            volume_var.set(state.get('volume', volume_var.get()))
+            autoplay_var.set(state.get('autoplay', False))
+            gapless_var.set(state.get('gapless', False))
+            crossfade_var.set(state.get('crossfade', 0))
+            if state.get('normalize') in normalize_combobox['values']:
+                normalize_var.set(state['normalize'])
+            eq.set_settings(state.get('eq', {}))
+            if state.get('spectrum'):
+                spectrum_var.set(True)
+                on_spectrum_change()
+            library_folder = state.get('folder')
+
+            playlist.extend(tracks)
+            if playlist:
+                current_index = min(max(int(state.get('index', 0)), 0), len(playlist) - 1)
+                resume_position = max(float(state.get('position', 0.0)), 0.0)
+                update_playlist_box(playing_idx=current_index)
+                update_track_info(cover=False)
 
-    check_music_end()
-    music_stats()
+                if state.get('shuffle'):
+                    try:
+                        shuffle_order = ShuffleOrder.from_state(len(playlist), state['shuffle'])
+                    except (KeyError, TypeError, ValueError):
+                        shuffle_order = ShuffleOrder(len(playlist), current_index)
+                    show_shuffle_state()
+            set_volume(volume_var.get())
+            update_position()
+
+        if playlist:
+            label_log.config(text=f"Restored {len(playlist)} track(s) from the last session")
+            # The cover and the waveform are read from the file, so they wait until the window is up
+            root.after(100, lambda: update_cover(frames["right"], default_image_tk, current_index))
+            root.after(100, show_waveform)
+            root.after(REVALIDATE_DELAY, revalidate_playlist)
+
+    def on_map(event):
+        """The window was shown again: resume the position updates and the scrolling texts"""
+        nonlocal startup_reported
+        if event.widget is root:
+            if not startup_reported:
+                startup_reported = True
+                shown = time.perf_counter() - STARTED
+                metrics.record('startup.window_shown', shown)
+                print(f"Startup: imports {imports_seconds * 1000:.0f} ms, window shown after {shown * 1000:.0f} ms")
+            scroll_ticker.wake()
+            if position_job is None:
+                update_position()
+            if spectrum_display is not None and spectrum_var.get():
+                spectrum_display.start()
+
+    # Playback events from the stream player, delivered on the Tk thread
+    root.bind("<<WaveformReady>>", lambda event: on_waveform_ready())
+    root.bind("<Map>", on_map)
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
     
+    restore_session()
+    root.after(SESSION_SAVE_INTERVAL, autosave_session)
+
     tray_icon = tray_handler.create_tray_icon()
     tray_thread = Thread(target=tray_handler.run_tray, daemon=True)
     tray_thread.start()
     
     root.mainloop()
+    save_metrics()
+    loudness_scanner.cancel()
+    if stream_player is not None:
+        stream_player.stop()
+    if audio_processor is not None:
+        audio_processor.render_cache.save()
     pygame.mixer.music.unload()
-    audio_processor.clear_cache()
+    library.close()
     tray_handler.stop_tray()
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+# Benchmarks for Starfruit Music Player
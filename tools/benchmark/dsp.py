@@ -0,0 +1,197 @@
+"""Benchmark of the equalizer render pipeline.
+
+Each step of AudioProcessor.render_file on a WAV file, the path the
+player's cached renders and the batch renderer take, is timed on its own,
+fed with the output of the step before it computed ahead of time:
+
+    decode    WavReader.blocks, from the memory map to float blocks
+    filter    AudioProcessor.filter_blocks, the EQ cascade (sosfilt)
+    encode    AudioProcessor.to_pcm16, the conversion to 16-bit samples
+    export    wave writeframes of those samples
+    render    the whole render_file call, for the overhead between steps
+
+The separate steps keep their whole output in memory, so their peak memory
+grows with the signal length while a real render holds a few blocks.
+
+MP3s go through PcmDecoder instead of WavReader, which mostly times
+ffmpeg, so they are left out.
+
+Uses synthetic mono/stereo signals at 44.1/48/96 kHz and needs no audio
+device. Run from the project folder with: python -m tools.benchmark.dsp
+
+    --save        store the results as the new baseline
+    --quick       only the shortest signal length
+    --tolerance   fraction of slowdown or extra memory flagged as a regression (default 0.2)
+
+Baselines are per machine and live in the app's data folder unless --baseline
+points elsewhere. The exit code is 1 when a regression is flagged.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+import numpy as np
+
+from tools.equalizer.audio_processor import AudioProcessor
+from tools.equalizer.wav_reader import WavReader
+from tools.paths import get_data_dir
+
+SAMPLE_RATES = (44100, 48000, 96000)
+CHANNELS = (1, 2)
+LENGTHS = (5, 30, 120)  # seconds
+STAGES = ('decode', 'filter', 'encode', 'export', 'render')
+BLOCK_FRAMES = 65536  # as in AudioProcessor._render_wav
+
+def make_signal(sample_rate, channels, seconds, seed=0):
+    """A few tones over pink-ish noise, as 16-bit interleaved PCM bytes"""
+    rng = np.random.default_rng(seed)
+    frames = int(sample_rate * seconds)
+    t = np.arange(frames) / sample_rate
+    tones = sum(np.sin(2 * np.pi * freq * t) for freq in (55, 440, 3520)) / 6
+    noise = np.cumsum(rng.standard_normal(frames)) * 1e-3
+    noise -= np.convolve(noise, np.ones(256) / 256, mode='same')
+    mono = np.clip(tones + noise, -1, 1)
+    samples = np.repeat(mono[:, None], channels, axis=1)
+    return (samples * 32767).astype(np.int16).tobytes()
+
+def write_wav(folder, sample_rate, channels, seconds):
+    file_path = os.path.join(folder, f"bench_{sample_rate}_{channels}_{seconds}.wav")
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(make_signal(sample_rate, channels, seconds))
+    return file_path
+
+class Pipeline:
+    """The steps of AudioProcessor's render path, each one callable on its own for timing"""
+    def __init__(self, audio_processor, input_file, output_file):
+        self.audio_processor = audio_processor
+        self.input_file = input_file
+        self.output_file = output_file
+        self.reader = WavReader(input_file)
+        self.sample_rate = self.reader.sample_rate
+        self.channels = self.reader.channels
+        # The input of every step, made once outside of the timings
+        self.blocks = self.decode()
+        self.filtered = self.filter()
+        self.pcm = self.encode()
+
+    def decode(self):
+        return list(self.reader.blocks(BLOCK_FRAMES))
+
+    def filter(self):
+        return list(self.audio_processor.filter_blocks(iter(self.blocks), self.sample_rate, self.channels))
+
+    def encode(self):
+        return [self.audio_processor.to_pcm16(chunk) for chunk in self.filtered]
+
+    def export(self):
+        with wave.open(self.output_file, 'wb') as output:
+            output.setnchannels(self.channels)
+            output.setsampwidth(2)
+            output.setframerate(self.sample_rate)
+            for data in self.pcm:
+                output.writeframes(data)
+
+    def render(self):
+        # render_file -> _render_wav -> _render_blocks, as for the EQ cache and batch renders
+        if not self.audio_processor.render_file(self.input_file, self.output_file):
+            raise RuntimeError(f"Could not render {self.input_file}")
+
+def run_stage(pipeline, stage, repeat):
+    """Best time of repeat runs, then the peak traced memory of one more run"""
+    step = getattr(pipeline, stage)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        step()
+        best = min(best, time.perf_counter() - started)
+
+    # Timed separately, as tracing slows allocations down
+    tracemalloc.start()
+    step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def run(lengths, repeat):
+    # Without the cache, which would also clean the user's temp folder
+    audio_processor = AudioProcessor(use_cache=False)
+    # A bass boost and treble cut, so every band of the cascade is active
+    audio_processor.set_eq_gains(1.6, 0.9, 0.5)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for sample_rate in SAMPLE_RATES:
+            for channels in CHANNELS:
+                for seconds in lengths:
+                    input_file = write_wav(folder, sample_rate, channels, seconds)
+                    pipeline = Pipeline(audio_processor, input_file, os.path.join(folder, "out.wav"))
+                    samples = sample_rate * channels * seconds
+                    for stage in STAGES:
+                        elapsed, peak = run_stage(pipeline, stage, repeat)
+                        results[f"{sample_rate}Hz/{channels}ch/{seconds}s/{stage}"] = {
+                            'seconds': elapsed,
+                            'samples_per_second': samples / elapsed,
+                            'realtime_factor': seconds / elapsed,
+                            'peak_bytes': peak,
+                        }
+                    os.remove(input_file)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print the results next to the baseline; returns the names of the regressed entries"""
+    regressions = []
+    print(f"{'case':<28} {'Msamples/s':>11} {'x realtime':>11} {'peak MB':>9}  vs baseline")
+    for name, result in results.items():
+        note = ""
+        reference = baseline.get(name)
+        if reference:
+            speed = result['samples_per_second'] / reference['samples_per_second']
+            memory = result['peak_bytes'] / max(reference['peak_bytes'], 1)
+            note = f"{speed:.2f}x speed, {memory:.2f}x memory"
+            if speed < 1 - tolerance or memory > 1 + tolerance:
+                note += "  REGRESSION"
+                regressions.append(name)
+        print(f"{name:<28} {result['samples_per_second'] / 1e6:>11.1f} {result['realtime_factor']:>11.0f} "
+              f"{result['peak_bytes'] / 2**20:>9.1f}  {note}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the equalizer render pipeline")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--quick', action='store_true', help="only the shortest signal length")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage, the best one counts")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="fraction flagged as a regression")
+    parser.add_argument('--baseline', default=os.path.join(get_data_dir('benchmark'), 'dsp_baseline.json'))
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+
+    results = run(LENGTHS[:1] if args.quick else LENGTHS, args.repeat)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print("No baseline yet; run with --save to store one")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
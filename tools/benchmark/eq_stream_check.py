@@ -0,0 +1,81 @@
+"""Checks that the streaming equalizer gives the same output as the render path.
+
+Test signals go through EqStream block by block, as the stream player feeds
+it, and are compared with AudioProcessor.apply_equalizer on the whole
+signal. The gain of sine tones from 60 Hz to 15 kHz is also compared with
+the response of the designed filter cascade. Needs no audio device.
+
+Run from the project folder with: python -m tools.benchmark.eq_stream_check
+The exit code is 1 when a difference is over the tolerance.
+"""
+import sys
+import numpy as np
+from scipy import signal
+
+from tools.equalizer.audio_processor import AudioProcessor
+from tools.equalizer.bands import graphic_preset, three_band_preset
+from tools.equalizer.stream_player import EqStream
+
+SAMPLE_RATES = (44100, 48000)
+BLOCK_FRAMES = (4096, 1000)
+TONES = (60, 125, 250, 500, 1000, 2000, 4000, 8000, 15000)  # Hz
+PRESETS = {
+    'bass boost, treble cut': three_band_preset(1.6, 0.9, 0.5),
+    'bass cut, treble boost': three_band_preset(0.5, 1.5, 1.8),
+    'graphic smile': graphic_preset((6, 4, 2, 0, -2, -2, 0, 2, 4, 6)),
+}
+SAMPLE_TOLERANCE = 1e-4  # largest difference between streamed and rendered samples
+GAIN_TOLERANCE = 0.001  # relative difference between measured and designed tone gain
+
+def stream(audio_processor, samples, sample_rate, block_frames):
+    eq_stream = EqStream(audio_processor, sample_rate, samples.shape[1])
+    return np.concatenate([eq_stream.process(samples[start:start + block_frames])
+                           for start in range(0, len(samples), block_frames)])
+
+def tone_gain(output, freq, sample_rate, amplitude):
+    """Gain of a steady sine in output, from a least-squares fit over its second half"""
+    half = len(output) // 2
+    t = np.arange(half, len(output)) / sample_rate
+    basis = np.column_stack([np.sin(2 * np.pi * freq * t), np.cos(2 * np.pi * freq * t)])
+    (a, b), *_ = np.linalg.lstsq(basis, output[half:, 0], rcond=None)
+    return np.hypot(a, b) / amplitude
+
+def check(audio_processor, sample_rate, block_frames, seconds=2.0, amplitude=0.25):
+    """(largest sample difference, largest relative tone gain error) for the current settings"""
+    rng = np.random.default_rng(0)
+    noise = (rng.standard_normal((int(sample_rate * seconds), 2)) * 0.1).astype(np.float32)
+    rendered = audio_processor.apply_equalizer(noise, sample_rate)
+    sample_error = float(np.abs(stream(audio_processor, noise, sample_rate, block_frames) - rendered).max())
+
+    sos = audio_processor.design_sos(sample_rate)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    gain_error = 0.0
+    for freq in TONES:
+        tone = np.repeat((amplitude * np.sin(2 * np.pi * freq * t))[:, None], 2, axis=1).astype(np.float32)
+        measured = tone_gain(stream(audio_processor, tone, sample_rate, block_frames), freq, sample_rate, amplitude)
+        designed = abs(signal.sosfreqz(sos, worN=[freq], fs=sample_rate)[1][0]) if sos is not None else 1.0
+        gain_error = max(gain_error, abs(measured / designed - 1))
+    return sample_error, gain_error
+
+def main():
+    audio_processor = AudioProcessor(use_cache=False)
+    failures = 0
+    print(f"{'preset':<24} {'rate':>6} {'block':>6} {'max sample diff':>16} {'max gain error':>15}")
+    for name, bands in PRESETS.items():
+        audio_processor.set_bands(bands)
+        for sample_rate in SAMPLE_RATES:
+            for block_frames in BLOCK_FRAMES:
+                sample_error, gain_error = check(audio_processor, sample_rate, block_frames)
+                failed = sample_error > SAMPLE_TOLERANCE or gain_error > GAIN_TOLERANCE
+                failures += failed
+                print(f"{name:<24} {sample_rate:>6} {block_frames:>6} {sample_error:>16.2e} "
+                      f"{gain_error:>14.4%}{'  FAIL' if failed else ''}")
+
+    if failures:
+        print(f"{failures} case(s) over the tolerance")
+        return 1
+    print("Streaming output matches the render path")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
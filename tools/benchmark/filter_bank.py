@@ -0,0 +1,32 @@
+"""Micro-benchmark of the equalizer filter setup cost.
+
+Run from the project folder with: python -m tools.benchmark.filter_bank
+"""
+import timeit
+
+from tools.equalizer.bands import graphic_preset, three_band_preset
+from tools.equalizer.filter_bank import FilterBank, design_biquad
+
+PRESETS = {
+    '3-band': three_band_preset(1.6, 0.9, 0.5),
+    '10-band': graphic_preset((6, 4, 2, 0, -2, -2, 0, 2, 4, 6)),
+}
+
+def design_every_call(sample_rate, bands):
+    """What get_cascade costs without its cache, i.e. for every block of every stream"""
+    return [design_biquad(kind, freq, gain_db, q, sample_rate) for kind, freq, gain_db, q in bands]
+
+def main(number=2000):
+    bank = FilterBank()
+
+    print(f"{'bands':>8} {'sample rate':>12} {'design (us)':>12} {'bank hit (us)':>14} {'speedup':>9}")
+    for name, bands in PRESETS.items():
+        for sample_rate in (44100, 48000, 96000):
+            design_time = timeit.timeit(lambda: design_every_call(sample_rate, bands), number=number) / number
+            bank.get_cascade(sample_rate, bands)
+            hit_time = timeit.timeit(lambda: bank.get_cascade(sample_rate, bands), number=number) / number
+            print(f"{name:>8} {sample_rate:>12} {design_time * 1e6:>12.1f} {hit_time * 1e6:>14.3f} "
+                  f"{design_time / hit_time:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
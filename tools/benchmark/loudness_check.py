@@ -0,0 +1,52 @@
+"""Checks the loudness meter on sine tones, whose true peak and loudness are known.
+
+Each tone is measured in one block and in blocks of several sizes, so a
+reading that depends on where the block edges fall shows up as a failure.
+
+Run from the project folder with: python -m tools.benchmark.loudness_check
+The exit code is 1 when a reading is off by more than the tolerance.
+"""
+import sys
+import numpy as np
+
+from tools.library.loudness import LoudnessMeter
+
+SAMPLE_RATE = 48000
+LEVELS = (-18.0, -1.0)  # dBFS peak of the tones
+TONES = (997, 1000, 5000)  # Hz
+BLOCK_FRAMES = (None, 65536, 4096, 1000)  # None is the whole tone in one block
+PEAK_TOLERANCE = 0.02  # dB; the true peak of a sine is its sample-domain amplitude
+LOUDNESS_TOLERANCE = 0.05  # LU, for the 997 Hz tone, which BS.1770 weights at about 0 dB
+
+def measure(samples, block_frames):
+    meter = LoudnessMeter(SAMPLE_RATE, samples.shape[1])
+    block_frames = block_frames or len(samples)
+    for start in range(0, len(samples), block_frames):
+        meter.add(samples[start:start + block_frames])
+    return meter.result()
+
+def main(seconds=10):
+    failures = 0
+    t = np.arange(SAMPLE_RATE * seconds) / SAMPLE_RATE
+    print(f"{'level':>6} {'tone':>6} {'block':>7} {'loudness':>9} {'true peak':>10}")
+    for level in LEVELS:
+        for freq in TONES:
+            tone = (10 ** (level / 20) * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+            samples = np.repeat(tone[:, None], 2, axis=1)
+            for block_frames in BLOCK_FRAMES:
+                loudness, true_peak = measure(samples, block_frames)
+                # A 997 Hz sine reads -3.01 LUFS per channel at 0 dBFS, so in both channels it reads its level
+                failed = abs(true_peak - level) > PEAK_TOLERANCE or (
+                    freq == 997 and abs(loudness - level) > LOUDNESS_TOLERANCE)
+                failures += failed
+                print(f"{level:>6.1f} {freq:>6} {block_frames or 'whole':>7} {loudness:>9.2f} {true_peak:>10.2f}"
+                      f"{'  FAIL' if failed else ''}")
+
+    if failures:
+        print(f"{failures} reading(s) over the tolerance")
+        return 1
+    print("Loudness and true peak readings match the tones")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""Memory used per playlist track, old dict entries against TrackStore.
+
+Run from the project folder with: python -m tools.benchmark.track_memory
+"""
+import os
+import tracemalloc
+
+from tools.playlist.track_store import Track, TrackStore
+
+def make_rows(count):
+    """Synthetic library: 100 tracks per album folder, 10 albums per artist"""
+    for idx in range(count):
+        artist = f"Artist {idx // 1000}"
+        album = f"Album {idx // 100}"
+        folder = os.path.join("/home/user/Music", artist, album)
+        yield os.path.join(folder, f"{idx % 100:02d} - Some Song Title {idx}.mp3"), artist, album
+
+def measure(build, count):
+    tracemalloc.start()
+    playlist = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del playlist
+    return size / count
+
+def build_dicts(count):
+    # Strings are rebuilt for every row, as when they come from tags and os.path.join
+    return [{'nome': os.path.basename(path)[:-4], 'caminho': path, 'artista': artist, 'album': album}
+            for path, artist, album in make_rows(count)]
+
+def build_store(count):
+    return TrackStore(Track(path, artist=artist, album=album) for path, artist, album in make_rows(count))
+
+def main(count=100000):
+    before = measure(build_dicts, count)
+    after = measure(build_store, count)
+    print(f"{count} tracks")
+    print(f"dict entries: {before:.0f} bytes/track")
+    print(f"TrackStore:   {after:.0f} bytes/track ({before / after:.1f}x smaller)")
+
+if __name__ == "__main__":
+    main()
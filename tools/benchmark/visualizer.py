@@ -0,0 +1,52 @@
+"""Cost of the waveform overview and of the live spectrum.
+
+Run from the project folder with: python -m tools.benchmark.visualizer
+"""
+import os
+import tempfile
+import time
+import timeit
+import wave
+
+import numpy as np
+
+from tools.library.waveform import WaveformCache
+from tools.visualizer.spectrum import SpectrumAnalyzer
+
+def write_test_wav(file_path, seconds, sample_rate=44100):
+    """Stereo 16-bit noise with a slow swell, written a minute at a time"""
+    rng = np.random.default_rng(0)
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for start in range(0, seconds, 60):
+            frames = min(60, seconds - start) * sample_rate
+            swell = np.sin(np.linspace(start, start + 60, frames) / 30)[:, None]
+            samples = rng.standard_normal((frames, 2)) * 0.2 * swell
+            f.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+
+def main(seconds=600, sample_rate=44100, frame_rate=25):
+    with tempfile.TemporaryDirectory() as folder:
+        track_path = os.path.join(folder, 'track.wav')
+        write_test_wav(track_path, seconds, sample_rate)
+        cache = WaveformCache(cache_dir=folder)
+
+        started = time.perf_counter()
+        cache.get(track_path)
+        computed = time.perf_counter() - started
+        started = time.perf_counter()
+        cache.get(track_path)
+        cached = time.perf_counter() - started
+    print(f"Waveform of a {seconds // 60} min WAV: {computed * 1000:.0f} ms computed "
+          f"({seconds / computed:.0f}x real time), {cached * 1000:.1f} ms from the cache")
+
+    analyzer = SpectrumAnalyzer(sample_rate)
+    block = np.random.default_rng(1).standard_normal((4096, 2)).astype(np.float32) * 0.2
+    number = 2000
+    frame = timeit.timeit(lambda: analyzer.update(block[-analyzer.fft_size:], 1 / frame_rate), number=number) / number
+    print(f"Spectrum analysis: {frame * 1e6:.0f} us per frame, {frame * frame_rate * 100:.2f}% of a core "
+          f"at {frame_rate} frames/s (the bars' redraw comes on top, see 'ui.spectrum_frame' in the metrics)")
+
+if __name__ == "__main__":
+    main()
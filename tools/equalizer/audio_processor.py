@@ -1,48 +1,71 @@
 """Audio processor to apply equalizer effects in real time"""
 import numpy as np
 from scipy import signal
-from pydub import AudioSegment
 import tempfile
 import os
+import wave
 import glob
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .render_cache import RenderCache
+    from .filter_bank import filter_bank, settle_frames, three_band_preset, FLAT_DB
+    from .wav_reader import WavReader
+    from .decoders import PcmDecoder, native_format
+    from ..metrics import metrics
+except ImportError:
+    from render_cache import RenderCache
+    from filter_bank import filter_bank, settle_frames, three_band_preset, FLAT_DB
+    from wav_reader import WavReader
+    from decoders import PcmDecoder, native_format
+    from tools.metrics import metrics
 
 class AudioProcessor:
-    def __init__(self):
+    def __init__(self, use_cache=True):
         self.eq_gains = [1.0, 1.0, 1.0]
+        self.bands = three_band_preset(1.0, 1.0, 1.0)
         self.sample_rate = 44100
-        self.processed_files = {}
+        # Batch renders write straight to their output folder and leave the cache alone
+        self.render_cache = RenderCache() if use_cache else None
         
-        # Clean old files on initialization
-        self.clean_old_eq_files(max_age_hours=24)
+        # Clean files left in the temp folder by older versions
+        if use_cache:
+            self.clean_old_eq_files(max_age_hours=0)
         
     def set_eq_gains(self, low, mid, high):
         """Set equalizer gains"""
-        # Clear processed files with old settings
-        self.clear_cache()
         self.eq_gains = [low, mid, high]
+        self.bands = three_band_preset(low, mid, high)
+
+    def set_bands(self, bands):
+        """Use an arbitrary list of (type, frequency, gain_db, q) bands, e.g. from graphic_preset"""
+        self.bands = tuple(tuple(band) for band in bands)
+
+    def is_flat(self):
+        """True when every band is at 0 dB and the audio passes through untouched"""
+        return all(abs(band[2]) < FLAT_DB for band in self.bands)
+
+    def design_sos(self, sample_rate):
+        """The current bands as one cascade of second-order sections, or None when flat.
+
+        Kept in float64: low bass bands have poles very close to the unit
+        circle and drift audibly when filtered in float32.
+        """
+        return filter_bank.get_cascade(sample_rate, self.bands)
+
+    def render_params(self):
+        """EQ parameters that identify a render in the cache"""
+        return ('biquad', self.bands)
+
+    def get_cached_render(self, input_file):
+        """Return the cached render of input_file for the current settings, or None"""
+        return self.render_cache.get(self.render_cache.make_key(input_file, self.render_params()))
         
     def clear_cache(self):
         """Clear processed files cache"""
         print("Clearing processed files cache...")
-        
-        removed_count = 0
-        for cache_key, temp_file in self.processed_files.items():
-            try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                    removed_count += 1
-                    print(f"File removed from cache: {os.path.basename(temp_file)}")
-            except Exception as e:
-                print(f"Error removing {temp_file}: {e}")
-        
-        self.processed_files.clear()
-        
-        # Also clean old files when cache is cleared
-        self.clean_old_eq_files(max_age_hours=0)  # Remove all eq_ files
-        
-        if removed_count > 0:
-            print(f"Cache cleared: {removed_count} file(s) removed")
+        self.render_cache.clear()
     
     def clean_old_eq_files(self, max_age_hours=24):
         """Remove old equalizer files from temp folder"""
@@ -73,169 +96,94 @@ class AudioProcessor:
             
             if removed_count > 0:
                 print(f"EQ cleanup completed: {removed_count} file(s) removed")
-            elif max_age_hours == 0:
-                print("No EQ files found for removal")
             
         except Exception as e:
             print(f"Error in EQ files cleanup: {e}")
-    
-    def _clear_previous_processed_files(self, input_file):
-        """Remove previously processed files for this specific song"""
-        try:
-            base_filename = os.path.basename(input_file)
-            # Remove from cache and file system any processed version of this song
-            keys_to_remove = []
-            for cache_key, temp_path in self.processed_files.items():
-                if base_filename in cache_key:
-                    try:
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
-                            print(f"Previous file removed: {os.path.basename(temp_path)}")
-                    except:
-                        pass
-                    keys_to_remove.append(cache_key)
-            
-            # Remove cache entries
-            for key in keys_to_remove:
-                del self.processed_files[key]
-                
-        except Exception as e:
-            print(f"Error clearing previous files: {e}")
         
-    def apply_equalizer(self, audio_array, sample_rate):
-        """Apply equalizer to audio array"""
-        if len(audio_array.shape) == 1:
-            return self._process_channel(audio_array, sample_rate)
+    def apply_equalizer(self, audio_array, sample_rate, segment_frames=262144, max_workers=None):
+        """Apply equalizer to audio array.
+
+        Every band is part of a single cascade of second-order sections, so
+        the cost is one filter pass whatever the number of bands, and flat
+        settings skip filtering altogether. Renders use the same filter as the
+        streaming path. Long tracks are split into segments that are filtered
+        on a thread pool (SciPy releases the GIL); each segment starts
+        filtering a little before its first frame so the filter state has
+        settled when its output begins.
+        """
+        audio_array = np.asarray(audio_array, dtype=np.float32)
+        sos = self.design_sos(sample_rate)
+        if sos is None:
+            return audio_array
+
+        warmup = settle_frames(sos)
+        processed = np.empty_like(audio_array)
+        if len(audio_array) <= segment_frames:
+            self._render_segment(audio_array, processed, 0, len(audio_array), sos, warmup)
         else:
-            processed = np.zeros_like(audio_array)
-            for i in range(audio_array.shape[1]):
-                processed[:, i] = self._process_channel(audio_array[:, i], sample_rate)
-            return processed
-            
-    def _process_channel(self, channel_data, sample_rate):
-        """Process one audio channel"""
-        # Cutoff frequencies
-        low_freq = 250    # Bass
-        mid_freq = 2000   # Mid  
-        high_freq = 8000  # Treble
-        
-        nyquist = sample_rate / 2
-        
-        try:
-            # Low-pass filter for bass
-            low_b, low_a = signal.butter(2, min(low_freq/nyquist, 0.99), btype='low')
-            low_band = signal.filtfilt(low_b, low_a, channel_data) * self.eq_gains[0]
-            
-            # Band-pass filter for mid
-            mid_low = min(low_freq/nyquist, 0.99)
-            mid_high = min(high_freq/nyquist, 0.99)
-            if mid_high > mid_low:
-                mid_b, mid_a = signal.butter(2, [mid_low, mid_high], btype='band')
-                mid_band = signal.filtfilt(mid_b, mid_a, channel_data) * self.eq_gains[1]
-            else:
-                mid_band = channel_data * self.eq_gains[1] * 0.1  # Reduce contribution if invalid
-            
-            # High-pass filter for treble
-            if high_freq/nyquist < 0.99:
-                high_b, high_a = signal.butter(2, high_freq/nyquist, btype='high')
-                high_band = signal.filtfilt(high_b, high_a, channel_data) * self.eq_gains[2]
-            else:
-                high_band = channel_data * self.eq_gains[2] * 0.1
-            
-            # Combine bands
-            processed = low_band + mid_band + high_band
-            
-            # Normalize to avoid clipping
-            max_val = np.max(np.abs(processed))
-            if max_val > 1.0:
-                processed = processed / max_val
-                
-            return processed
-            
-        except Exception as e:
-            print(f"Error in audio processing: {e}")
-            # In case of error, return original audio with average gain
-            return channel_data * np.mean(self.eq_gains)
-    
-    def process_file(self, input_file):
-        """Process an audio file and return the path of the processed file"""
-        # Remove previously processed files for this song
-        self._clear_previous_processed_files(input_file)
-        
-        # Clean old equalizer files before processing new file
-        self.clean_old_eq_files(max_age_hours=0.5)  # Remove files older than 30 minutes
-        
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+                self._render_segments(pool, audio_array, processed, 0, sos, warmup, segment_frames)
+
+        return processed
+
+    def _render_segments(self, pool, audio_array, processed, first, sos, warmup, segment_frames):
+        """Filter audio_array[first:] into processed[first:] in segments on pool; earlier frames only warm up"""
+        jobs = [pool.submit(self._render_segment, audio_array, processed, start,
+                            min(start + segment_frames, len(audio_array)), sos, warmup)
+                for start in range(first, len(audio_array), segment_frames)]
+        for job in jobs:
+            job.result()
+
+    def _render_segment(self, audio_array, processed, start, end, sos, warmup):
+        """Filter audio_array[start:end] into the same slice of processed (float64 math, float32 storage)"""
+        read_start = max(0, start - warmup)
+        output = processed[start:end]
+        output[:] = signal.sosfilt(sos, audio_array[read_start:end], axis=0)[start - read_start:]
+
+        # Same limiter as the streaming path
+        np.clip(output, -1.0, 1.0, out=output)
+
+    def process_file(self, input_file, cancel_event=None):
+        """Process an audio file and return the path of the processed file.
+
+        If cancel_event is set while rendering, the work is dropped and the
+        original path is returned. With flat settings the original path is
+        returned straight away, as a render would be a plain copy.
+        """
         # Check if file exists first
         if not os.path.exists(input_file):
             print(f"File not found: {input_file}")
             return input_file
+        if self.is_flat():
+            return input_file
             
         # Normalize path to avoid issues with special characters
         input_file = os.path.normpath(input_file)
         
         # Check if already processed with these settings
-        cache_key = f"{os.path.basename(input_file)}_{self.eq_gains[0]:.1f}_{self.eq_gains[1]:.1f}_{self.eq_gains[2]:.1f}"
-        
-        if cache_key in self.processed_files and os.path.exists(self.processed_files[cache_key]):
-            return self.processed_files[cache_key]
+        cache_key = self.render_cache.make_key(input_file, self.render_params())
+        cached_path = self.render_cache.get(cache_key)
+        if cached_path:
+            return cached_path
         
         try:
             print(f"Processing file: {input_file}")
             
-            # Load audio file with encoding handling
-            if input_file.lower().endswith('.mp3'):
-                # Try different encodings for files with special characters
-                audio = AudioSegment.from_file(input_file, format="mp3")
-            elif input_file.lower().endswith('.wav'):
-                audio = AudioSegment.from_file(input_file, format="wav")
-            else:
-                print(f"Unsupported format: {input_file}")
-                return input_file  # Return original if format not supported
-            
-            # Convert to numpy array
-            samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
-            
-            # Normalize to range -1 to 1
-            samples = samples / (2**(audio.sample_width * 8 - 1))
-            
-            # Reshape for stereo if necessary
-            if audio.channels == 2:
-                samples = samples.reshape((-1, 2))
-            
-            # Apply equalization
-            processed_samples = self.apply_equalizer(samples, audio.frame_rate)
-            
-            # Convert back to original format
-            processed_samples = (processed_samples * (2**(audio.sample_width * 8 - 1))).astype(np.int16)
-            
-            # Create new AudioSegment
-            if audio.channels == 2:
-                processed_samples = processed_samples.flatten()
-            
-            processed_audio = AudioSegment(
-                processed_samples.tobytes(),
-                frame_rate=audio.frame_rate,
-                sample_width=audio.sample_width,
-                channels=audio.channels
-            )
-            
-            # Save temporary file with safe name
-            import string
-            import random
-            safe_chars = string.ascii_letters + string.digits
-            temp_name = ''.join(random.choice(safe_chars) for _ in range(10))
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav', prefix=f'eq_{temp_name}_')
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            # Export processed audio
-            processed_audio.export(temp_path, format="wav")
-            
-            # Add to cache
-            self.processed_files[cache_key] = temp_path
+            # Render under a temporary name, then move it into the cache
+            temp_path = self.render_cache.new_path(cache_key)
+            try:
+                if not self.render_file(input_file, temp_path, cancel_event):
+                    return input_file
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            output_path = self.render_cache.add(cache_key, temp_path)
+            if output_path is None:
+                return input_file
             
-            print(f"Processed file saved at: {temp_path}")
-            return temp_path
+            print(f"Processed file saved at: {output_path}")
+            return output_path
             
         except FileNotFoundError as e:
             print(f"File not found: {input_file} - {e}")
@@ -249,13 +197,130 @@ class AudioProcessor:
         except Exception as e:
             print(f"Error processing file {input_file}: {e}")
             return input_file  # Return original file in case of error
-    
-    def __del__(self):
-        """Clean temporary files when destroying object"""
+
+    def render_file(self, input_file, output_path, cancel_event=None, max_workers=None):
+        """Equalize input_file into a 16-bit WAV file at output_path, filtering on max_workers threads.
+
+        Returns False, leaving no output, if the format is not supported or
+        cancel_event is set while rendering. Decoding errors are raised.
+        """
+        if input_file.lower().endswith('.wav'):
+            try:
+                reader = WavReader(input_file)
+            except ValueError as e:
+                # Compressed or unusual WAV encodings still go through ffmpeg
+                print(f"Using ffmpeg for {input_file}: {e}")
+            else:
+                with metrics.span('eq.render_wav'):
+                    return self._render_wav(input_file, reader, output_path, cancel_event, max_workers)
+        elif not input_file.lower().endswith('.mp3'):
+            print(f"Unsupported format: {input_file}")
+            return False
+
+        with metrics.span('eq.render_decoded'):
+            return self._render_decoded(input_file, output_path, cancel_event, max_workers)
+
+    def _render_wav(self, input_file, reader, output_path, cancel_event=None, max_workers=None, block_frames=65536):
+        """Render a WAV file block by block from its memory map"""
+        return self._render_blocks(input_file, reader.blocks(block_frames), reader.sample_rate, reader.channels,
+                                   output_path, cancel_event, max_workers=max_workers)
+
+    def _render_decoded(self, input_file, output_path, cancel_event=None, max_workers=None, block_frames=65536):
+        """Render a file ffmpeg decodes (MP3, unusual WAV) block by block, at its own sample rate"""
+        sample_rate, channels = native_format(input_file)
+        decoder = PcmDecoder(input_file, sample_rate, channels, block_frames)
         try:
-            print("Destroying AudioProcessor - cleaning temporary files...")
-            self.clear_cache()
-            # Remove all remaining EQ files
-            self.clean_old_eq_files(max_age_hours=0)
-        except:
-            pass
+            return self._render_blocks(input_file, iter(decoder), sample_rate, channels, output_path, cancel_event,
+                                       max_workers=max_workers)
+        finally:
+            decoder.close()
+
+    def _render_blocks(self, input_file, blocks, sample_rate, channels, output_path, cancel_event=None,
+                       max_workers=None):
+        """Equalize (frames, channels) float blocks into a 16-bit WAV file, writing as it goes.
+
+        The steps are filter_blocks() and to_pcm16(), then the wave writer;
+        the DSP benchmark times each of them on its own.
+        """
+        frames = 0
+        with wave.open(output_path, 'wb') as output:
+            output.setnchannels(channels)
+            output.setsampwidth(2)
+            output.setframerate(sample_rate)
+
+            for chunk in self.filter_blocks(blocks, sample_rate, channels, cancel_event, max_workers):
+                output.writeframes(self.to_pcm16(chunk))
+                frames += len(chunk)
+
+        if cancel_event is not None and cancel_event.is_set():
+            print(f"Processing cancelled: {input_file}")
+            os.remove(output_path)
+            return False
+        if not frames:
+            os.remove(output_path)
+            raise ValueError(f"No audio decoded from {input_file}")
+        return True
+
+    def filter_blocks(self, blocks, sample_rate, channels, cancel_event=None, max_workers=None,
+                      segment_frames=262144):
+        """Yields the equalized audio of (frames, channels) float blocks, in chunks.
+
+        Blocks are gathered into chunks of one segment per worker, and the
+        segments of a chunk are filtered on a thread pool like in
+        apply_equalizer, the first one warming up on the end of the previous
+        chunk. Memory use is a few segments whatever the length of the track,
+        and cancel_event is checked before every block. On one core the
+        filter state is simply carried from block to block.
+        """
+        # Designed once, so the render matches the settings it was started with
+        sos = self.design_sos(sample_rate)
+        workers = max_workers or os.cpu_count() or 1
+        if sos is None:
+            yield from self._gather(blocks, 1, cancel_event)
+        elif workers == 1:
+            yield from self._filter_serial(self._gather(blocks, 1, cancel_event), sos, channels)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                yield from self._filter_parallel(self._gather(blocks, segment_frames * workers, cancel_event),
+                                                 pool, sos, channels, segment_frames)
+
+    @staticmethod
+    def to_pcm16(block):
+        """Float samples to little-endian 16-bit PCM bytes, clipped like the streaming path"""
+        return (np.clip(block, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+    @staticmethod
+    def _gather(blocks, chunk_frames, cancel_event=None):
+        """Join blocks into chunks of at least chunk_frames (the last may be shorter); stops when cancelled"""
+        pending = []
+        pending_frames = 0
+        for block in blocks:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            pending.append(block)
+            pending_frames += len(block)
+            if pending_frames >= chunk_frames:
+                yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+                pending = []
+                pending_frames = 0
+        if pending and not (cancel_event is not None and cancel_event.is_set()):
+            yield np.concatenate(pending)
+
+    @staticmethod
+    def _filter_serial(chunks, sos, channels):
+        """Filter chunks one after the other, carrying the filter state across them"""
+        state = np.zeros((sos.shape[0], 2, channels))
+        for chunk in chunks:
+            chunk, state = signal.sosfilt(sos, chunk, axis=0, zi=state)
+            yield chunk
+
+    def _filter_parallel(self, chunks, pool, sos, channels, segment_frames):
+        """Filter chunks as overlapped segments on pool, each chunk warming up on the end of the one before"""
+        warmup = settle_frames(sos)
+        history = np.zeros((0, channels), dtype=np.float32)
+        for chunk in chunks:
+            audio_array = np.concatenate([history, chunk])
+            processed = np.empty_like(audio_array)
+            self._render_segments(pool, audio_array, processed, len(history), sos, warmup, segment_frames)
+            history = audio_array[max(len(audio_array) - warmup, 0):]
+            yield processed[len(audio_array) - len(chunk):]
@@ -0,0 +1,20 @@
+"""Equalizer band presets, in plain Python so the GUI can use them without loading NumPy"""
+import math
+
+# Centre frequencies of the 10-band graphic equalizer
+GRAPHIC_BAND_FREQS = (31, 62, 125, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# Bands closer than this to 0 dB are left out of the cascade
+FLAT_DB = 0.01
+
+def three_band_preset(low, mid, high):
+    """Bass/Mid/Treble linear gains (0 to 2) as shelving and peaking bands of (type, frequency, gain_db, q)"""
+    def to_db(gain):
+        return round(20 * math.log10(max(gain, 1 / 16)), 3)
+    return (('lowshelf', 250, to_db(low), 0.707),
+            ('peaking', 2000, to_db(mid), 0.7),
+            ('highshelf', 8000, to_db(high), 0.707))
+
+def graphic_preset(gains_db):
+    """10-band graphic equalizer gains in dB as peaking bands"""
+    return tuple(('peaking', freq, float(gain_db), 1.41) for freq, gain_db in zip(GRAPHIC_BAND_FREQS, gains_db))
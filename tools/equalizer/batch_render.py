@@ -0,0 +1,168 @@
+"""Render whole folders through the equalizer without the GUI.
+
+Run from the project folder with:
+
+    python -m tools.equalizer.batch_render INPUT_FOLDER OUTPUT_FOLDER --gains 1.4 1.0 0.8
+    python -m tools.equalizer.batch_render INPUT_FOLDER OUTPUT_FOLDER --graphic 6 4 2 0 0 0 0 -2 -4 -6
+
+--gains takes the bass, mid and treble slider values of the equalizer window
+(0 to 2, 1 is flat) and --graphic the 10 band gains in dB. The folder tree is
+mirrored in OUTPUT_FOLDER as 16-bit WAV files named after the whole source
+file name, e.g. song.mp3.wav, so song.mp3 and song.wav do not overwrite each
+other. Files whose source and EQ settings have not changed since the last
+run are skipped. OUTPUT_FOLDER may be inside INPUT_FOLDER; it is not
+searched for music.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import wave
+
+try:
+    from .audio_processor import AudioProcessor
+    from .filter_bank import graphic_preset, three_band_preset, GRAPHIC_BAND_FREQS
+    from ..library.tags import is_music_file
+except ImportError:
+    from audio_processor import AudioProcessor
+    from filter_bank import graphic_preset, three_band_preset, GRAPHIC_BAND_FREQS
+    from tools.library.tags import is_music_file
+
+MANIFEST_NAME = '.starfruit_eq.json'
+
+# Set in each worker process by _init_worker
+_audio_processor = None
+
+def _init_worker(bands):
+    global _audio_processor
+    _audio_processor = AudioProcessor(use_cache=False)
+    _audio_processor.set_bands(bands)
+
+def _render(job):
+    """Worker: render one file. Returns (relative path, error or None, seconds, audio seconds)"""
+    relative_path, input_file, output_file = job
+    started = time.perf_counter()
+    temp_file = output_file + '.part'
+    try:
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        # The same code path the player uses for its EQ renders, on one thread as the pool has a process per core
+        if not _audio_processor.render_file(input_file, temp_file, max_workers=1):
+            return relative_path, "unsupported format", time.perf_counter() - started, 0
+        os.replace(temp_file, output_file)
+        with wave.open(output_file, 'rb') as output:
+            audio_seconds = output.getnframes() / output.getframerate()
+        return relative_path, None, time.perf_counter() - started, audio_seconds
+    except Exception as e:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        return relative_path, str(e), time.perf_counter() - started, 0
+
+def find_music_files(folder, skip_folder=None):
+    """Relative paths of the music files under folder, in name order, leaving out skip_folder and its subfolders"""
+    skip_folder = os.path.normcase(os.path.abspath(skip_folder)) if skip_folder else None
+    found = []
+    for current, subfolders, files in os.walk(folder):
+        subfolders[:] = [name for name in subfolders
+                         if os.path.normcase(os.path.abspath(os.path.join(current, name))) != skip_folder]
+        subfolders.sort(key=str.lower)
+        for file_name in sorted(files, key=str.lower):
+            if is_music_file(file_name):
+                found.append(os.path.relpath(os.path.join(current, file_name), folder))
+    return found
+
+def output_name(relative_path):
+    # The source extension stays in the name, so every source has an output of its own
+    return relative_path + '.wav'
+
+def load_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_folder, manifest):
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def render_folder(input_folder, output_folder, bands, processes=None, force=False):
+    """Render every music file of input_folder into output_folder; returns the number of failures"""
+    input_folder = os.path.abspath(input_folder)
+    output_folder = os.path.abspath(output_folder)
+    if os.path.normcase(input_folder) == os.path.normcase(output_folder):
+        raise ValueError("the output folder must not be the input folder, or renders would be taken for sources")
+    os.makedirs(output_folder, exist_ok=True)
+
+    manifest = load_manifest(output_folder)
+    params = repr(('biquad', tuple(tuple(band) for band in bands)))
+
+    jobs = []
+    sources = {}
+    skipped = 0
+    for relative_path in find_music_files(input_folder, output_folder):
+        input_file = os.path.join(input_folder, relative_path)
+        output_file = os.path.join(output_folder, output_name(relative_path))
+        stat = os.stat(input_file)
+        source = [stat.st_size, stat.st_mtime_ns, params]
+        if not force and manifest.get(relative_path) == source and os.path.exists(output_file):
+            skipped += 1
+            continue
+        sources[relative_path] = source
+        jobs.append((relative_path, input_file, output_file))
+
+    print(f"{len(jobs)} file(s) to render, {skipped} up to date")
+    if not jobs:
+        return 0
+
+    started = time.perf_counter()
+    total_audio = 0.0
+    failures = 0
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(bands,)) as pool:
+        for done, (relative_path, error, seconds, audio_seconds) in enumerate(pool.imap_unordered(_render, jobs), 1):
+            if error:
+                failures += 1
+                print(f"[{done}/{len(jobs)}] FAILED {relative_path}: {error}")
+                continue
+
+            total_audio += audio_seconds
+            print(f"[{done}/{len(jobs)}] {relative_path}: {audio_seconds:.0f}s of audio in {seconds:.2f}s "
+                  f"({audio_seconds / seconds:.0f}x realtime)")
+            manifest[relative_path] = sources[relative_path]
+            if done % 20 == 0:
+                save_manifest(output_folder, manifest)
+
+    save_manifest(output_folder, manifest)
+    elapsed = time.perf_counter() - started
+    rendered = len(jobs) - failures
+    print(f"Rendered {rendered} file(s), {total_audio / 60:.1f} min of audio, in {elapsed:.1f}s: "
+          f"{rendered / elapsed:.2f} files/s, {total_audio / elapsed:.0f}x realtime, {failures} failure(s)")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render folders through the Starfruit equalizer")
+    parser.add_argument('input_folder')
+    parser.add_argument('output_folder')
+    settings = parser.add_mutually_exclusive_group(required=True)
+    settings.add_argument('--gains', type=float, nargs=3, metavar=('BASS', 'MID', 'TREBLE'),
+                          help="equalizer window slider values, 0 to 2 (1 is flat)")
+    settings.add_argument('--graphic', type=float, nargs=len(GRAPHIC_BAND_FREQS), metavar='DB',
+                          help=f"gains in dB for the {len(GRAPHIC_BAND_FREQS)} graphic EQ bands")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--force', action='store_true', help="render files even if they are up to date")
+    args = parser.parse_args(argv)
+
+    bands = three_band_preset(*args.gains) if args.gains else graphic_preset(args.graphic)
+    try:
+        failures = render_folder(args.input_folder, args.output_folder, bands, args.processes, args.force)
+    except ValueError as e:
+        parser.error(str(e))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
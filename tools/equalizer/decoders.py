@@ -0,0 +1,122 @@
+"""Block decoders shared by playback, renders and analysis"""
+import subprocess
+import numpy as np
+from mutagen import File as MutagenFile
+from pydub import AudioSegment
+
+try:
+    from .wav_reader import WavReader
+    from ..library.mp3_frames import frame_indexes
+except ImportError:
+    from wav_reader import WavReader
+    from tools.library.mp3_frames import frame_indexes
+
+def native_format(input_file):
+    """(sample rate, channels) of a music file, read from its headers; raises ValueError if unknown"""
+    try:
+        info = MutagenFile(input_file).info
+        return int(info.sample_rate), int(info.channels)
+    except Exception as e:
+        raise ValueError(f"Unknown audio format: {input_file}") from e
+
+class PcmDecoder:
+    """Decodes a file to 16-bit PCM through ffmpeg and yields it in blocks"""
+    def __init__(self, input_file, sample_rate, channels, block_frames=4096, start_frame=0):
+        self.input_file = input_file
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.start_frame = start_frame
+        self.process = None
+
+    def __iter__(self):
+        command = [AudioSegment.converter, '-v', 'quiet']
+        skip_frames = 0
+        if self.start_frame:
+            seek = self._frame_seek()
+            if seek is not None:
+                # Start ffmpeg on the exact frame, then drop the samples before the requested one
+                offset, position = seek
+                command += ['-skip_initial_bytes', str(offset), '-f', 'mp3']
+                skip_frames = max(self.start_frame - int(round(position * self.sample_rate)), 0)
+            else:
+                command += ['-ss', f"{self.start_frame / self.sample_rate:.6f}"]
+        command += [
+            '-i', self.input_file,
+            '-f', 's16le', '-acodec', 'pcm_s16le',
+            '-ar', str(self.sample_rate), '-ac', str(self.channels), '-'
+        ]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        block_bytes = self.block_frames * self.channels * 2
+
+        try:
+            while True:
+                data = self.process.stdout.read(block_bytes)
+                if not data:
+                    break
+                # Drop a trailing partial frame, if any
+                usable = len(data) - len(data) % (self.channels * 2)
+                samples = np.frombuffer(data[:usable], dtype=np.int16).reshape((-1, self.channels))
+                if skip_frames:
+                    dropped = min(skip_frames, len(samples))
+                    samples = samples[dropped:]
+                    skip_frames -= dropped
+                    if not len(samples):
+                        continue
+                yield samples.astype(np.float32) / 32768.0
+        finally:
+            self.close()
+
+    def _frame_seek(self):
+        """(byte offset, position in seconds) of the MP3 frame holding start_frame, or None to let ffmpeg seek"""
+        if not self.input_file.lower().endswith('.mp3'):
+            return None
+        try:
+            return frame_indexes.get(self.input_file).seek_point(self.start_frame / self.sample_rate)
+        except (OSError, ValueError) as e:
+            print(f"Could not index the frames of {self.input_file}: {e}")
+            return None
+
+    def close(self):
+        """Stop the decoder process"""
+        if self.process:
+            try:
+                self.process.kill()
+                self.process.stdout.close()
+                self.process.wait()
+            except Exception:
+                pass
+            self.process = None
+
+class WavDecoder:
+    """Yields blocks straight from a memory-mapped WAV file, without an ffmpeg process"""
+    def __init__(self, reader, channels, block_frames=4096, start_frame=0):
+        self.reader = reader
+        self.channels = channels
+        self.block_frames = block_frames
+        self.start_frame = start_frame
+        self.closed = False
+
+    def __iter__(self):
+        for block in self.reader.blocks(self.block_frames, self.start_frame):
+            # close() may come from another thread, so it only raises a flag
+            if self.closed:
+                break
+            if self.reader.channels != self.channels:
+                # Mono file on a stereo mixer
+                block = np.repeat(block, self.channels, axis=1)
+            yield block
+
+    def close(self):
+        self.closed = True
+
+def open_decoder(input_file, sample_rate, channels, block_frames=4096, start_frame=0):
+    """The cheapest decoder for a file, from start_frame on: WAV files already at the mixer rate are read directly"""
+    if input_file.lower().endswith('.wav'):
+        try:
+            reader = WavReader(input_file)
+        except (OSError, ValueError):
+            reader = None
+        if reader and reader.sample_rate == sample_rate and reader.channels in (1, channels):
+            return WavDecoder(reader, channels, block_frames, start_frame)
+    return PcmDecoder(input_file, sample_rate, channels, block_frames, start_frame)
@@ -1,16 +1,63 @@
 import tkinter as tk
 try:
-    from .audio_processor import AudioProcessor
+    from .bands import graphic_preset, GRAPHIC_BAND_FREQS
 except ImportError:
-    from audio_processor import AudioProcessor
+    from bands import graphic_preset, GRAPHIC_BAND_FREQS
 
 class Eq:
     """Class to manage the audio equalizer in real time"""
-    def __init__(self):
+    def __init__(self, audio_processor_factory=None):
         self.eq_gains = [1.0, 1.0, 1.0]
-        self.audio_processor = AudioProcessor()
+        self.graphic_gains = [0.0] * len(GRAPHIC_BAND_FREQS)  # dB, used in 10-band mode
+        self.graphic_mode = False
+        self._audio_processor = None
+        self._audio_processor_factory = audio_processor_factory
         self.callback = None  # Callback to notify changes in the main app
         self.enabled = False
+
+    @property
+    def audio_processor(self):
+        """The AudioProcessor, created on first use so NumPy and SciPy only load once the EQ is used"""
+        if self._audio_processor is None:
+            if self._audio_processor_factory:
+                self.audio_processor = self._audio_processor_factory()
+            else:
+                try:
+                    from .audio_processor import AudioProcessor
+                except ImportError:
+                    from audio_processor import AudioProcessor
+                self.audio_processor = AudioProcessor()
+        return self._audio_processor
+
+    @audio_processor.setter
+    def audio_processor(self, audio_processor):
+        # A new processor starts flat, so hand it the current settings
+        self._audio_processor = audio_processor
+        if audio_processor is not None:
+            if self.graphic_mode:
+                audio_processor.set_bands(graphic_preset(self.graphic_gains))
+            else:
+                audio_processor.set_eq_gains(*self.eq_gains)
+
+    def get_settings(self):
+        """The equalizer state as plain values, for saving the session"""
+        return {
+            'enabled': self.enabled,
+            'graphic_mode': self.graphic_mode,
+            'eq_gains': list(self.eq_gains),
+            'graphic_gains': list(self.graphic_gains),
+        }
+
+    def set_settings(self, settings):
+        """Restore a state from get_settings(); reaches the audio processor when it is created"""
+        self.enabled = bool(settings.get('enabled', self.enabled))
+        self.graphic_mode = bool(settings.get('graphic_mode', self.graphic_mode))
+        if len(settings.get('eq_gains', ())) == len(self.eq_gains):
+            self.eq_gains = [float(gain) for gain in settings['eq_gains']]
+        if len(settings.get('graphic_gains', ())) == len(self.graphic_gains):
+            self.graphic_gains = [float(gain) for gain in settings['graphic_gains']]
+        if self._audio_processor is not None:
+            self.audio_processor = self._audio_processor
         
     def set_callback(self, callback_func):
         """Defines a callback function to communicate with the main player"""
@@ -44,6 +91,30 @@ class Eq:
         if self.callback:
             self.callback(self.eq_gains)
 
+    def apply_graphic_eq(self, sliders):
+        """Apply the 10-band graphic equalizer"""
+        if not self.enabled:
+            self.status_label.config(text="Equalizer is disabled")
+            return
+
+        self.graphic_gains = [slider.get() for slider in sliders]
+        self.audio_processor.set_bands(graphic_preset(self.graphic_gains))
+
+        if hasattr(self, 'status_label'):
+            self.status_label.config(text="EQ: " + " ".join(f"{gain:+.0f}" for gain in self.graphic_gains) + " dB")
+
+        print(f"Graphic equalizer settings updated: {self.graphic_gains}")
+
+        if self.callback:
+            self.callback(self.graphic_gains)
+
+    def apply_active(self, slider1, slider2, slider3, graphic_sliders):
+        """Apply whichever equalizer mode is shown in the window"""
+        if self.graphic_mode:
+            self.apply_graphic_eq(graphic_sliders)
+        else:
+            self.apply_eq(slider1, slider2, slider3)
+
     def open_window(self):
         window = tk.Toplevel()
         window.title("Equalizer")
@@ -86,24 +157,57 @@ class Eq:
         slider3.set(self.eq_gains[2])
         slider3.pack(pady=10)
 
+        # 10-band graphic equalizer, shown instead of the three sliders
+        graphic_frame = tk.Frame(main_frame, bg="#5A262C")
+        graphic_sliders = []
+        for i, freq in enumerate(GRAPHIC_BAND_FREQS):
+            label = f"{freq // 1000}k" if freq >= 1000 else str(freq)
+            slider = tk.Scale(graphic_frame, from_=12, to=-12, resolution=0.5,
+                              orient=tk.VERTICAL, label=label,
+                              bg="#5A262C", fg="white", highlightbackground="#5A262C",
+                              length=160, width=10, font=("Arial", 8))
+            slider.set(self.graphic_gains[i])
+            slider.grid(row=0, column=i)
+            graphic_sliders.append(slider)
+
+        three_band_sliders = (slider1, slider2, slider3)
+        graphic_var = tk.BooleanVar(value=self.graphic_mode)
+
+        def show_mode():
+            self.graphic_mode = graphic_var.get()
+            if self.graphic_mode:
+                for slider in three_band_sliders:
+                    slider.pack_forget()
+                graphic_frame.pack(pady=10, before=button_frame)
+            else:
+                graphic_frame.pack_forget()
+                for slider in three_band_sliders:
+                    slider.pack(pady=10, before=button_frame)
+
+        graphic_check = tk.Checkbutton(main_frame, text="10-band graphic equalizer", variable=graphic_var,
+                                       command=show_mode, bg="#5A262C", fg="white",
+                                       selectcolor="#321316", activebackground="#5A262C",
+                                       activeforeground="white", font=("Arial", 10))
+        graphic_check.pack()
+
         # Buttons
         button_frame = tk.Frame(main_frame, bg="#5A262C")
         button_frame.pack(pady=20)
 
         apply_btn = tk.Button(button_frame, text="Apply Equalizer", 
-                             command=lambda: self.apply_eq(slider1, slider2, slider3),
+                             command=lambda: self.apply_active(slider1, slider2, slider3, graphic_sliders),
                              bg="#321316", fg="white", font=("Arial", 10, "bold"),
                              padx=20, pady=5, cursor="hand2")
         apply_btn.pack(side="left", padx=5)
 
         reset_btn = tk.Button(button_frame, text="Reset", 
-                             command=lambda: self.reset_eq(slider1, slider2, slider3),
+                             command=lambda: self.reset_eq(slider1, slider2, slider3, graphic_sliders),
                              bg="#4A1A1D", fg="white", font=("Arial", 10),
                              padx=20, pady=5, cursor="hand2")
         reset_btn.pack(side="left", padx=5)
 
         self.toggle_btn = tk.Button(button_frame, text="Toggle EQ", 
-                                   command=lambda: self.toggle_eq(slider1, slider2, slider3),
+                                   command=lambda: self.toggle_eq(slider1, slider2, slider3, graphic_sliders),
                                    bg="#5A1A1D", fg="white", font=("Arial", 10),
                                    padx=20, pady=5, cursor="hand2")
         self.toggle_btn.pack(side="left", padx=5)
@@ -111,6 +215,9 @@ class Eq:
         self.status_label = tk.Label(main_frame, text="Ready to use", 
                                     bg="#5A262C", fg="#CCCCCC", font=("Arial", 9))
         self.status_label.pack(pady=(10, 0))
+
+        if self.graphic_mode:
+            show_mode()
         
         # Update initial button state and status based on current state
         if self.enabled:
@@ -120,35 +227,37 @@ class Eq:
             self.toggle_btn.config(text="Enable EQ")
             self.status_label.config(text="Equalizer disabled")
 
-    def reset_eq(self, slider1, slider2, slider3):
-        """Reset all sliders to 1.0"""
+    def reset_eq(self, slider1, slider2, slider3, graphic_sliders=()):
+        """Reset all sliders to 1.0 (0 dB in 10-band mode)"""
         slider1.set(1.0)
         slider2.set(1.0)
         slider3.set(1.0)
+        for slider in graphic_sliders:
+            slider.set(0.0)
         self.eq_gains = [1.0, 1.0, 1.0]
-        self.audio_processor.set_eq_gains(1.0, 1.0, 1.0)
+        self.graphic_gains = [0.0] * len(GRAPHIC_BAND_FREQS)
+        # While disabled, the sliders are applied when the EQ is turned on
+        if self.enabled:
+            self.audio_processor.set_eq_gains(1.0, 1.0, 1.0)
         self.status_label.config(text="Equalizer reset to default")
 
         # Notify the main player
         if self.callback:
             self.callback(self.eq_gains)
     
-    def toggle_eq(self, slider1, slider2, slider3):
+    def toggle_eq(self, slider1, slider2, slider3, graphic_sliders=()):
         """Enable or disable the equalizer"""
         self.enabled = not self.enabled
         
         if self.enabled:
             self.toggle_btn.config(text="Disable EQ")
             self.status_label.config(text="Equalizer enabled")
-            self.apply_eq(slider1, slider2, slider3)
+            self.apply_active(slider1, slider2, slider3, graphic_sliders)
         else:
             self.toggle_btn.config(text="Enable EQ")
             self.status_label.config(text="Equalizer disabled")
-
-            self.audio_processor.clear_cache()
-            self.audio_processor.clean_old_eq_files(max_age_hours=0)  # Remove ALL eq_ files
             
-            print("Equalizer disabled - temporary files removed")
+            print("Equalizer disabled")
 
             if self.callback:
                 self.callback([1.0, 1.0, 1.0])
@@ -0,0 +1,91 @@
+"""Cache of designed equalizer filters"""
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    from .bands import GRAPHIC_BAND_FREQS, FLAT_DB, three_band_preset, graphic_preset
+except ImportError:
+    from bands import GRAPHIC_BAND_FREQS, FLAT_DB, three_band_preset, graphic_preset
+
+def design_biquad(kind, freq, gain_db, q, sample_rate):
+    """One peaking or shelving band as a second-order section (Audio EQ Cookbook formulas)"""
+    amp = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * freq / sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2 * q)
+
+    if kind == 'peaking':
+        b = [1 + alpha * amp, -2 * cos_w0, 1 - alpha * amp]
+        a = [1 + alpha / amp, -2 * cos_w0, 1 - alpha / amp]
+    elif kind == 'lowshelf':
+        root = 2 * np.sqrt(amp) * alpha
+        b = [amp * ((amp + 1) - (amp - 1) * cos_w0 + root),
+             2 * amp * ((amp - 1) - (amp + 1) * cos_w0),
+             amp * ((amp + 1) - (amp - 1) * cos_w0 - root)]
+        a = [(amp + 1) + (amp - 1) * cos_w0 + root,
+             -2 * ((amp - 1) + (amp + 1) * cos_w0),
+             (amp + 1) + (amp - 1) * cos_w0 - root]
+    elif kind == 'highshelf':
+        root = 2 * np.sqrt(amp) * alpha
+        b = [amp * ((amp + 1) + (amp - 1) * cos_w0 + root),
+             -2 * amp * ((amp - 1) + (amp + 1) * cos_w0),
+             amp * ((amp + 1) + (amp - 1) * cos_w0 - root)]
+        a = [(amp + 1) - (amp - 1) * cos_w0 + root,
+             2 * ((amp - 1) - (amp + 1) * cos_w0),
+             (amp + 1) - (amp - 1) * cos_w0 - root]
+    else:
+        raise ValueError(f"Unknown band type: {kind}")
+
+    return np.array(b + a) / a[0]
+
+class FilterBank:
+    """Designs equalizer cascades once per (sample rate, bands) and hands out the cached coefficients.
+
+    Only the most recent `max_items` designs are kept, since every slider
+    position makes a new one. Returned arrays are shared and must not be
+    modified.
+    """
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._designs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cascade(self, sample_rate, bands, dtype=np.float64):
+        """Return all bands fused into one cascade of second-order sections.
+
+        bands is a tuple of (type, frequency, gain_db, q). Flat bands and bands
+        above the Nyquist frequency are left out; None means every band is flat
+        and the audio can bypass the filter.
+        """
+        key = (sample_rate, bands, np.dtype(dtype))
+        with self._lock:
+            design = self._designs.get(key, False)
+            if design is not False:
+                self._designs.move_to_end(key)
+                return design
+
+        sections = [design_biquad(kind, freq, gain_db, q, sample_rate)
+                    for kind, freq, gain_db, q in bands
+                    if abs(gain_db) >= FLAT_DB and freq < sample_rate * 0.49]
+        design = np.array(sections, dtype=dtype) if sections else None
+        with self._lock:
+            self._designs[key] = design
+            if len(self._designs) > self.max_items:
+                self._designs.popitem(last=False)
+        return design
+
+    def clear(self):
+        with self._lock:
+            self._designs.clear()
+
+def settle_frames(sos, tolerance=1e-7):
+    """Number of frames after which the filter's memory of earlier input has decayed below tolerance"""
+    radius = max(np.max(np.abs(np.roots(section[3:]))) for section in np.asarray(sos, dtype=np.float64))
+    if radius <= 0:
+        return 0
+    # Cascaded sections repeat their poles, which decay slower than r**n, hence the factor of two
+    return 2 * int(np.ceil(np.log(tolerance) / np.log(radius)))
+
+# Shared by every AudioProcessor, stream and render in the process
+filter_bank = FilterBank()
@@ -0,0 +1,59 @@
+"""Background pre-render of the upcoming track"""
+import threading
+
+class Prefetcher:
+    """Renders the next track into the EQ cache on a worker thread, so the hand-off is instant.
+
+    There is a single worker: a new request cancels the running render, and
+    the worker starts the new one once the old one has stopped, at most one
+    block later since renders check for cancellation block by block.
+    Skipping through tracks never runs two renders at once, and only the
+    latest request is rendered.
+    """
+    def __init__(self, audio_processor):
+        self.audio_processor = audio_processor
+        self.job = None  # (input file, EQ parameters) being rendered or waiting
+        self._request = None  # (input file, cancel event) waiting for the worker
+        self._cancel_event = threading.Event()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def request(self, input_file):
+        """Render input_file with the current EQ settings, replacing any other job"""
+        job = (input_file, self.audio_processor.render_params())
+        with self._condition:
+            if job == self.job:
+                return
+
+        self.cancel()
+        if self.audio_processor.get_cached_render(input_file):
+            return
+
+        with self._condition:
+            self.job = job
+            self._cancel_event = threading.Event()
+            self._request = (input_file, self._cancel_event)
+            self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def cancel(self):
+        """Stop the running job; a partially rendered track is discarded"""
+        with self._condition:
+            self._cancel_event.set()
+            self._request = None
+            self.job = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                (input_file, cancel_event), self._request = self._request, None
+
+            print(f"Pre-rendering next track: {input_file}")
+            self.audio_processor.process_file(input_file, cancel_event=cancel_event)
+            with self._condition:
+                if self._cancel_event is cancel_event:
+                    self.job = None
@@ -0,0 +1,150 @@
+"""Persistent on-disk cache of equalized renders"""
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+try:
+    from ..paths import file_key, get_data_dir
+except ImportError:
+    from tools.paths import file_key, get_data_dir
+
+class RenderCache:
+    """Size-capped LRU cache of rendered WAV files.
+
+    Entries are keyed by the source file identity (path, size and mtime) plus
+    the exact EQ parameters, so renders survive restarts and two songs with the
+    same name in different folders never collide. The LRU order lives in an
+    index file next to the renders; a cache hit only reorders it in memory,
+    and the index is written on add, eviction, clear() and save(). Renders are written under a name of their
+    own and only take the key's name in add(), so two jobs for the same key
+    never write to, or remove, each other's file.
+    """
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, cache_dir=None, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir or get_data_dir('eq_cache')
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (file name, size), least recently used first
+        self.total_bytes = 0
+        self._dirty = False  # the LRU order changed since the index was written
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def make_key(self, input_file, params):
+        """Build the cache key for a source file and a set of EQ parameters"""
+        try:
+            return file_key(input_file, repr(params))
+        except OSError:
+            return None
+
+    def get(self, key):
+        """Return the path of a cached render, or None"""
+        if key is None:
+            return None
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            file_path = os.path.join(self.cache_dir, entry[0])
+            if not os.path.exists(file_path):
+                self._drop(key)
+                self._dirty = True
+                return None
+
+            self.entries.move_to_end(key)
+            self._dirty = True
+            return file_path
+
+    def new_path(self, key):
+        """Unique temporary path where a new render for this key is written before add()"""
+        return os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.part")
+
+    def add(self, key, file_path):
+        """Move a finished render from new_path() into the cache and evict old ones if over the size limit.
+
+        Returns the path of the cached render, or None if it could not be added.
+        """
+        final_path = os.path.join(self.cache_dir, f"{key}.wav")
+        with self._lock:
+            try:
+                size = os.path.getsize(file_path)
+                os.replace(file_path, final_path)
+            except OSError as e:
+                # e.g. on Windows, while the older render of this key is being played
+                print(f"Could not add {file_path} to the EQ cache: {e}")
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+                return None
+
+            if key in self.entries:
+                self._drop(key, remove_file=False)
+            self.entries[key] = (os.path.basename(final_path), size)
+            self.total_bytes += size
+
+            # Always keep the newest render, even if it alone is over the limit
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                oldest = next(iter(self.entries))
+                self._drop(oldest)
+
+            self._save_index()
+        return final_path
+
+    def save(self):
+        """Write the index if hits changed the LRU order, e.g. when the player exits"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def clear(self):
+        """Remove every cached render"""
+        with self._lock:
+            for key in list(self.entries):
+                self._drop(key)
+            self._save_index()
+
+    def _drop(self, key, remove_file=True):
+        file_name, size = self.entries.pop(key)
+        self.total_bytes -= size
+        if remove_file:
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, file_name, size in data.get('entries', []):
+                if os.path.exists(os.path.join(self.cache_dir, file_name)):
+                    self.entries[key] = (file_name, size)
+                    self.total_bytes += size
+        except (OSError, ValueError):
+            pass
+
+        # Remove renders that are not in the index (e.g. interrupted writes)
+        known = {file_name for file_name, _ in self.entries.values()}
+        for file_name in os.listdir(self.cache_dir):
+            if file_name != self.INDEX_NAME and file_name not in known:
+                try:
+                    os.remove(os.path.join(self.cache_dir, file_name))
+                except OSError:
+                    pass
+
+    def _save_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+        temp_path = index_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': [[key, file_name, size] for key, (file_name, size) in self.entries.items()]}, f)
+            os.replace(temp_path, index_path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Could not save the EQ cache index: {e}")
@@ -0,0 +1,458 @@
+"""Block-based streaming playback with the equalizer applied on the fly"""
+import queue
+import threading
+import time
+from collections import deque
+import numpy as np
+from scipy import signal
+import pygame.mixer
+
+try:
+    from .decoders import open_decoder
+    from ..metrics import metrics
+except ImportError:
+    from decoders import open_decoder
+    from tools.metrics import metrics
+
+class EqStream:
+    """Stateful equalizer that processes audio one block at a time"""
+    def __init__(self, audio_processor, sample_rate, channels):
+        self.audio_processor = audio_processor
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        """Clear the filter memory, e.g. before a new track"""
+        self.state = None
+
+    def process(self, block):
+        """Equalize a (frames, channels) float32 block, keeping filter state between calls"""
+        # Looked up for every block, so changed settings apply right away
+        sos = self.audio_processor.design_sos(self.sample_rate)
+        if sos is None:
+            self.state = None
+            return block
+
+        if self.state is None or self.state.shape[0] != sos.shape[0]:
+            self.state = np.zeros((sos.shape[0], 2, self.channels))
+        processed, self.state = signal.sosfilt(sos, block, axis=0, zi=self.state)
+
+        # The whole track is not known in advance, so clip instead of normalizing
+        np.clip(processed, -1.0, 1.0, out=processed)
+        return processed
+
+class StreamSource:
+    """A track queued on the StreamPlayer, with its decoder started ahead of time"""
+    def __init__(self, input_file, equalize, tag, sample_rate, channels, block_frames, gain=1.0, start_frame=0):
+        self.input_file = input_file
+        self.equalize = equalize  # False for files that are already equalized
+        self.tag = tag  # reported back by pop_track_change()
+        self.gain = gain  # linear loudness normalization gain
+        self.start_frame = start_frame  # where in the track decoding starts
+        self.decoder = open_decoder(input_file, sample_rate, channels, block_frames, start_frame)
+        self._blocks = iter(self.decoder)
+        self._first_block = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._read_first_block, daemon=True).start()
+
+    def _read_first_block(self):
+        try:
+            with metrics.span('stream.first_block'):
+                self._first_block = next(self._blocks, None)
+        except Exception as e:
+            print(f"Error while decoding {self.input_file}: {e}")
+        finally:
+            self._ready.set()
+
+    def blocks(self):
+        """Decoded float32 blocks, starting with the one read ahead"""
+        self._ready.wait()
+        if self._first_block is None:
+            return
+        yield self._first_block
+        yield from self._blocks
+
+    def close(self):
+        self.decoder.close()
+
+class StreamPlayer:
+    """Plays files in small blocks on a dedicated mixer channel, optionally through the equalizer.
+
+    Exposes the same calls the app uses on pygame.mixer.music, so both can be
+    driven the same way. A track queued with queue_next() is decoded ahead and
+    spliced sample-accurately onto the current one, with an optional
+    crossfade. The mixer must be initialized with 16-bit samples.
+
+    on_track_change() and on_end() report when a queued track starts playing
+    and when playback runs out. The worker thread only queues them, and they
+    are called from dispatch_events(), which the caller runs on its own thread
+    (the app polls it from the Tk loop), so the worker never waits on the UI.
+    Each play() starts a worker with a stop event of its own, so a worker
+    that outlives stop() can neither queue audio nor report events.
+    """
+    def __init__(self, audio_processor, block_frames=4096):
+        self.audio_processor = audio_processor
+        self.block_frames = block_frames
+        self.crossfade_seconds = 0.0
+        self.input_file = None
+        self.equalize = True
+        self.gain = 1.0
+        self.channel = None
+        self.volume = 1.0
+        self.on_track_change = None
+        self.on_end = None
+
+        self._thread = None
+        self._stop_event = threading.Event()  # of the latest worker
+        self._events = queue.SimpleQueue()  # (stop event of the worker, callback name) for dispatch_events()
+        self._resume_event = threading.Event()  # clear while paused, so the worker sleeps until unpause() or stop()
+        self._resume_event.set()
+        self._sample_rate = 44100
+        self._lock = threading.Lock()
+        self._source = None
+        self._next_source = None
+        self._paused = False
+        self._pause_started = 0.0
+        # Position bookkeeping: the block playing now and the one queued after it
+        self._current = None  # (source, first frame in its track, frames, start time)
+        self._pending = None  # (source, first frame in its track, frames)
+        # The samples of both, as they left the equalizer, for visualizations
+        self._current_block = None
+        self._pending_block = None
+        self._track_change = None
+
+    def load(self, input_file, equalize=True, gain=1.0):
+        self.stop()
+        self.input_file = input_file
+        self.equalize = equalize
+        self.gain = gain
+
+    def unload(self):
+        self.stop()
+        self.input_file = None
+
+    def play(self, loops=0, start=0.0):
+        """Start streaming the loaded file, start seconds in. loops is ignored, it only mirrors pygame.mixer.music"""
+        self.stop()
+        if not self.input_file:
+            return
+
+        if self.channel is None:
+            # Keep this channel away from any Sound played elsewhere
+            self.channel = pygame.mixer.Channel(0)
+            pygame.mixer.set_reserved(1)
+        self.channel.set_volume(self.volume)
+
+        self._stop_event = stop_event = threading.Event()
+        self._paused = False
+        self._resume_event.set()
+        with self._lock:
+            self._current = None
+            self._pending = None
+            self._current_block = None
+            self._pending_block = None
+            self._track_change = None
+        sample_rate = self._sample_rate = pygame.mixer.get_init()[0]
+        self._source = self._make_source(self.input_file, self.equalize, self.input_file, self.gain,
+                                         int(max(start, 0.0) * sample_rate))
+        self._thread = threading.Thread(target=self._run, args=(self._source, stop_event), daemon=True)
+        self._thread.start()
+
+    def queue_next(self, input_file, equalize=True, tag=None, gain=1.0):
+        """Decode input_file ahead and play it right after the current track (None clears the queue)"""
+        with self._lock:
+            previous = self._next_source
+            self._next_source = None
+            if input_file and self._thread is not None:
+                self._next_source = self._make_source(input_file, equalize, tag, gain)
+        if previous:
+            previous.close()
+
+    def set_equalize(self, equalize):
+        """Turn the equalizer on or off for the track being played"""
+        self.equalize = equalize
+        if self._source:
+            self._source.equalize = equalize
+
+    def set_gain(self, gain):
+        """Change the loudness normalization gain of the track being played"""
+        self.gain = gain
+        if self._source:
+            self._source.gain = gain
+
+    def dispatch_events(self):
+        """Call on_track_change() and on_end() for what happened since the last call, on the calling thread.
+        Events from playback that was stopped since are dropped"""
+        while True:
+            try:
+                stop_event, name = self._events.get_nowait()
+            except queue.Empty:
+                return
+            callback = getattr(self, name)
+            if callback is not None and not stop_event.is_set():
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error in stream player callback: {e}")
+
+    def pop_track_change(self):
+        """Tag of the queued track if playback moved on to it since the last call, else None"""
+        with self._lock:
+            tag, self._track_change = self._track_change, None
+        return tag
+
+    def pause(self):
+        if self.channel and not self._paused:
+            self.channel.pause()
+            self._resume_event.clear()
+            self._paused = True
+            self._pause_started = time.monotonic()
+
+    def unpause(self):
+        if self.channel and self._paused:
+            self.channel.unpause()
+            with self._lock:
+                if self._current:
+                    source, first_frame, frames, started = self._current
+                    self._current = (source, first_frame, frames, started + time.monotonic() - self._pause_started)
+            self._paused = False
+            self._resume_event.set()
+
+    def stop(self):
+        # Under the lock, so a worker queuing a block finishes before and any later block is dropped
+        with self._lock:
+            self._stop_event.set()
+        self._resume_event.set()
+        for source in (self._source, self._next_source):
+            if source:
+                source.close()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.channel:
+            self.channel.stop()
+        self._source = None
+        self._next_source = None
+        self._paused = False
+
+    def get_busy(self):
+        """True while a track is playing; False when paused or finished, like pygame.mixer.music"""
+        return self._thread is not None and self._thread.is_alive() and not self._paused
+
+    def get_pos(self):
+        """Position in the current track in milliseconds, or -1 if nothing is playing"""
+        if self._thread is None:
+            return -1
+
+        sample_rate = pygame.mixer.get_init()[0]
+        with self._lock:
+            if self._current is None:
+                return self._source.start_frame * 1000 // sample_rate if self._source else 0
+            _, first_frame, frames, started = self._current
+            now = self._pause_started if self._paused else time.monotonic()
+            elapsed = int((now - started) * sample_rate)
+            position = first_frame + min(max(elapsed, 0), frames)
+        return position * 1000 // sample_rate
+
+    def get_playing_frames(self, count):
+        """Up to count float frames of what is being heard now, or None when nothing plays.
+
+        They are the samples after gain and equalizer, sliced from the block
+        on the channel; no copy is made, so callers must not modify them.
+        """
+        if self._thread is None or self._paused:
+            return None
+
+        sample_rate = pygame.mixer.get_init()[0]
+        with self._lock:
+            if self._current is None or self._current_block is None:
+                return None
+            block, started = self._current_block, self._current[3]
+        heard = min(max(int((time.monotonic() - started) * sample_rate), 0), len(block))
+        start = max(min(heard - count, len(block) - count), 0)
+        return block[start:start + count]
+
+    def set_volume(self, volume):
+        self.volume = volume
+        if self.channel:
+            self.channel.set_volume(volume)
+
+    def _make_source(self, input_file, equalize, tag, gain=1.0, start_frame=0):
+        sample_rate, _, channels = pygame.mixer.get_init()
+        return StreamSource(input_file, equalize, tag, sample_rate, channels, self.block_frames, gain, start_frame)
+
+    def _processed_blocks(self, source, eq_stream):
+        """Blocks of a source with its gain applied, equalized when it asks for it"""
+        eq_stream.reset()
+        for block in source.blocks():
+            # Gain first, so attenuated loud masters leave the EQ some headroom
+            if source.gain != 1.0:
+                block = block * np.float32(source.gain)
+            yield eq_stream.process(block) if source.equalize else block
+
+    def _run(self, source, stop_event):
+        """Worker: decode, equalize and queue blocks until the queue of tracks runs out or stop() is called"""
+        sample_rate, _, channels = pygame.mixer.get_init()
+        block_seconds = self.block_frames / sample_rate
+        eq_stream = EqStream(self.audio_processor, sample_rate, channels)
+
+        try:
+            blocks = self._processed_blocks(source, eq_stream)
+            position = source.start_frame
+            while True:
+                crossfade_frames = int(self.crossfade_seconds * sample_rate)
+
+                # Hold back the last crossfade_frames of the track for mixing with the next one
+                held = deque()
+                held_frames = 0
+                for block in blocks:
+                    held.append(block)
+                    held_frames += len(block)
+                    while held and held_frames - len(held[0]) >= crossfade_frames:
+                        block = held.popleft()
+                        held_frames -= len(block)
+                        if not self._emit(stop_event, block, source, position, block_seconds):
+                            return
+                        position += len(block)
+
+                tail = np.concatenate(held) if held else np.zeros((0, channels), dtype=np.float32)
+                if len(tail) > crossfade_frames:
+                    if not self._emit(stop_event, tail[:-crossfade_frames], source, position, block_seconds):
+                        return
+                    position += len(tail) - crossfade_frames
+                    tail = tail[-crossfade_frames:]
+
+                with self._lock:
+                    next_source, self._next_source = self._next_source, None
+                if next_source is None:
+                    if len(tail) and not self._emit(stop_event, tail, source, position, block_seconds):
+                        return
+                    break
+
+                source.close()
+                source = next_source
+                with self._lock:
+                    if stop_event.is_set():
+                        return
+                    self._source = source
+                    self.input_file = source.input_file
+                    self.equalize = source.equalize
+                    self.gain = source.gain
+                blocks = self._processed_blocks(source, eq_stream)
+                position = 0
+
+                if len(tail):
+                    # Mix the end of the last track with the start of the new one
+                    head = np.zeros((0, channels), dtype=np.float32)
+                    for block in blocks:
+                        head = np.concatenate([head, block])
+                        if len(head) >= len(tail):
+                            break
+                    mixed_frames = min(len(head), len(tail))
+                    fade = np.linspace(0.0, 1.0, len(tail), dtype=np.float32)[:, None]
+                    mixed = tail * np.cos(fade * np.pi / 2)
+                    mixed[:mixed_frames] += head[:mixed_frames] * np.sin(fade[:mixed_frames] * np.pi / 2)
+                    if not self._emit(stop_event, mixed, source, 0, block_seconds):
+                        return
+                    position = len(mixed)
+                    if len(head) > mixed_frames:
+                        if not self._emit(stop_event, head[mixed_frames:], source, position, block_seconds):
+                            return
+                        position += len(head) - mixed_frames
+
+            # Let the last blocks drain before reporting the end of the track
+            while self.channel.get_busy() or self._paused:
+                self._update_position(stop_event)
+                if self._wait(block_seconds, stop_event):
+                    return
+            self._update_position(stop_event)
+        except Exception as e:
+            if not stop_event.is_set():
+                print(f"Error while streaming {source.input_file}: {e}")
+        finally:
+            source.close()
+
+        self._notify(stop_event, 'on_end')
+
+    def _emit(self, stop_event, block, source, first_frame, block_seconds):
+        """Queue one block on the channel, waiting for a free slot. Returns False if stopped"""
+        pcm = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+        sound = pygame.mixer.Sound(buffer=pcm.tobytes())
+
+        # Wait for a free slot in the channel queue
+        while self.channel.get_busy() and self.channel.get_queue() is not None:
+            self._update_position(stop_event)
+            if self._wait(block_seconds, stop_event):
+                return False
+
+        self._update_position(stop_event)
+        changed = False
+        with self._lock:
+            # Checked under the lock, as play() resets the bookkeeping under it too
+            if stop_event.is_set():
+                return False
+            if not self.channel.get_busy() and not self._paused:
+                self.channel.play(sound)
+                metrics.end('player.time_to_first_audio')
+                changed = self._start_block((source, first_frame, len(pcm)))
+                self._current_block = block
+            else:
+                self.channel.queue(sound)
+                self._pending = (source, first_frame, len(pcm))
+                self._pending_block = block
+        if changed:
+            self._notify(stop_event, 'on_track_change')
+        return True
+
+    def _wait(self, block_seconds, stop_event):
+        """Sleep until the block playing now should end, or while paused until unpause() or stop().
+        Returns True if stop() was called"""
+        if self._paused:
+            self._resume_event.wait()
+        else:
+            stop_event.wait(self._until_block_end(block_seconds))
+        return stop_event.is_set()
+
+    def _until_block_end(self, block_seconds):
+        """Seconds until the block playing now should end"""
+        with self._lock:
+            current = self._current
+        if current is not None:
+            _, _, frames, started = current
+            remaining = started + frames / self._sample_rate - time.monotonic()
+            if remaining > 0:
+                return remaining + 0.002
+        # Past its expected end the mixer is a little behind, or nothing is booked yet: look again shortly
+        return block_seconds / 8
+
+    def _update_position(self, stop_event):
+        """Notice when the queued block has started playing"""
+        changed = False
+        with self._lock:
+            if not stop_event.is_set() and self._pending is not None and (self.channel.get_queue() is None or not self.channel.get_busy()):
+                # It started when the previous block ended, which may be a little before it was noticed
+                started = None
+                if self._current is not None:
+                    _, _, frames, previous_start = self._current
+                    started = min(previous_start + frames / self._sample_rate, time.monotonic())
+                changed = self._start_block(self._pending, started)
+                self._current_block = self._pending_block
+                self._pending = None
+                self._pending_block = None
+        if changed:
+            self._notify(stop_event, 'on_track_change')
+
+    def _start_block(self, block, started=None):
+        """Book the block that started playing at started (now by default). Returns True if it starts another track"""
+        source = block[0]
+        changed = self._current is not None and self._current[0] is not source
+        if changed:
+            self._track_change = source.tag
+        self._current = block + (started if started is not None else time.monotonic(),)
+        return changed
+
+    def _notify(self, stop_event, name):
+        """Queue the callback called name for dispatch_events(), unless this worker was stopped"""
+        if not stop_event.is_set():
+            self._events.put((stop_event, name))
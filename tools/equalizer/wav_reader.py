@@ -0,0 +1,103 @@
+"""Memory-mapped WAV reader"""
+import struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class WavReader:
+    """Reads the samples of a PCM or float WAV file straight from a memory map.
+
+    Only the header is parsed up front. blocks() maps the data chunk one
+    window at a time and converts one block at a time to float32, so memory
+    use does not grow with the length of the file.
+    """
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.format = None
+        self.channels = 0
+        self.sample_rate = 0
+        self.sample_width = 0  # bytes per sample
+        self.data_offset = 0
+        self.frames = 0
+        self._parse_header()
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def blocks(self, block_frames=4096, start_frame=0, window_frames=1 << 20):
+        """Yields (frames, channels) float32 blocks in the range -1 to 1"""
+        frame_bytes = self.channels * self.sample_width
+        window_frames = max(window_frames, block_frames)
+
+        for window_start in range(start_frame, self.frames, window_frames):
+            window_end = min(window_start + window_frames, self.frames)
+            window = np.memmap(self.input_file, dtype=np.uint8, mode='r',
+                               offset=self.data_offset + window_start * frame_bytes,
+                               shape=((window_end - window_start) * frame_bytes,))
+            try:
+                for start in range(0, window_end - window_start, block_frames):
+                    end = min(start + block_frames, window_end - window_start)
+                    yield self._to_float(window[start * frame_bytes:end * frame_bytes])
+            finally:
+                # Unmap the window so its pages do not stay resident; blocks are copies
+                del window
+
+    def _to_float(self, raw):
+        """Raw little-endian sample bytes to a (frames, channels) float32 array"""
+        if self.format == WAVE_FORMAT_IEEE_FLOAT:
+            samples = raw.view('<f4') if self.sample_width == 4 else raw.view('<f8').astype(np.float32)
+            return samples.reshape((-1, self.channels)).astype(np.float32, copy=True)
+
+        if self.sample_width == 1:
+            samples = (raw.astype(np.float32) - 128.0) * (1.0 / 128)
+        elif self.sample_width == 2:
+            samples = raw.view('<i2').astype(np.float32) * (1.0 / 32768)
+        elif self.sample_width == 3:
+            triplets = raw.reshape((-1, 3))
+            values = (triplets[:, 2].view(np.int8).astype(np.int32) << 16) \
+                | (triplets[:, 1].astype(np.int32) << 8) | triplets[:, 0]
+            samples = values.astype(np.float32) * (1.0 / 8388608)
+        else:
+            samples = raw.view('<i4').astype(np.float32) * (1.0 / 2147483648)
+        return samples.reshape((-1, self.channels))
+
+    def _parse_header(self):
+        with open(self.input_file, 'rb') as f:
+            riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave_id != b'WAVE':
+                raise ValueError(f"Not a RIFF/WAVE file: {self.input_file}")
+
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"No data chunk in {self.input_file}")
+                chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    self.format, self.channels, self.sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                    if self.format == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        self.format = struct.unpack('<H', fmt[24:26])[0]
+                    self.sample_width = bits // 8
+                    f.seek(chunk_size % 2, 1)
+                elif chunk_id == b'data':
+                    if not self.channels:
+                        raise ValueError(f"Data chunk before fmt chunk in {self.input_file}")
+                    self.data_offset = f.tell()
+                    file_size = f.seek(0, 2)
+                    # Some writers leave the size at 0 or 0xFFFFFFFF when streaming; trust the file size then
+                    data_size = min(chunk_size, file_size - self.data_offset) if chunk_size else file_size - self.data_offset
+                    self.frames = data_size // (self.channels * self.sample_width)
+                    break
+                else:
+                    f.seek(chunk_size + chunk_size % 2, 1)
+
+        if self.format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+            raise ValueError(f"Unsupported WAV encoding {self.format:#x} in {self.input_file}")
+        if self.format == WAVE_FORMAT_PCM and self.sample_width not in (1, 2, 3, 4):
+            raise ValueError(f"Unsupported WAV sample width {self.sample_width * 8} bits in {self.input_file}")
+        if self.format == WAVE_FORMAT_IEEE_FLOAT and self.sample_width not in (4, 8):
+            raise ValueError(f"Unsupported WAV float width {self.sample_width * 8} bits in {self.input_file}")
@@ -0,0 +1 @@
+# Music library module for Starfruit Music Player
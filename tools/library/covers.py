@@ -0,0 +1,105 @@
+"""Cover art thumbnails"""
+import io
+import os
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+from mutagen.id3 import ID3
+from mutagen.wave import WAVE
+
+from ..metrics import metrics
+from ..paths import file_key, get_data_dir
+
+def read_cover_data(track_path):
+    """Returns the bytes of the first embedded cover (APIC frame), or None"""
+    try:
+        if track_path.lower().endswith('.wav'):
+            tags = WAVE(track_path).tags
+        else:
+            tags = ID3(track_path)
+        if tags is not None:
+            for frame in tags.getall('APIC'):
+                return frame.data
+    except Exception:
+        pass
+    return None
+
+class CoverCache:
+    """Cover thumbnails kept as ready PhotoImages in memory and as small JPEGs on disk.
+
+    Thumbnails on disk are keyed by the track's path, size and mtime, so a
+    cover is decoded from the tags at most once per file version. PhotoImages
+    must be created and used on the Tk thread.
+    """
+    def __init__(self, size=(120, 120), memory_items=64, cache_dir=None):
+        self.size = size
+        self.memory_items = memory_items
+        self.cache_dir = cache_dir or get_data_dir('covers')
+        self.photos = OrderedDict()  # key -> PhotoImage, or None when the track has no cover
+
+    def get_photo(self, track_path, has_cover=None):
+        """PhotoImage thumbnail of the track's cover, or None if it has none"""
+        key = self._key(track_path)
+        if key is None:
+            return None
+
+        if key in self.photos:
+            self.photos.move_to_end(key)
+            return self.photos[key]
+
+        image = self.get_image(track_path, has_cover, key)
+        photo = ImageTk.PhotoImage(image) if image is not None else None
+
+        self.photos[key] = photo
+        if len(self.photos) > self.memory_items:
+            self.photos.popitem(last=False)
+        return photo
+
+    def get_image(self, track_path, has_cover=None, key=None):
+        """PIL thumbnail of the track's cover, or None, using the disk cache"""
+        key = key or self._key(track_path)
+        if key is None or has_cover is False:
+            return None
+
+        thumb_path = os.path.join(self.cache_dir, key + '.jpg')
+        none_path = os.path.join(self.cache_dir, key + '.none')
+        if os.path.exists(none_path):
+            return None
+        if os.path.exists(thumb_path):
+            try:
+                with metrics.span('cover.thumbnail_load'), Image.open(thumb_path) as image:
+                    image.load()
+                    return image
+            except OSError:
+                pass
+
+        with metrics.span('cover.decode'):
+            image = self._decode(track_path)
+        try:
+            if image is None:
+                open(none_path, 'wb').close()
+            else:
+                image.save(thumb_path, 'JPEG', quality=90)
+        except OSError as e:
+            print(f"Could not cache cover of {os.path.basename(track_path)}: {e}")
+        return image
+
+    def _decode(self, track_path):
+        data = read_cover_data(track_path)
+        if data is None:
+            return None
+        try:
+            image = Image.open(io.BytesIO(data))
+            # JPEG covers are decoded straight at a reduced scale (no effect on other formats)
+            image.draft('RGB', (self.size[0] * 2, self.size[1] * 2))
+            return image.convert('RGB').resize(self.size)
+        except Exception as e:
+            print(f"Could not decode cover of {os.path.basename(track_path)}: {e}")
+            return None
+
+    @staticmethod
+    def _key(track_path):
+        try:
+            return file_key(track_path)
+        except OSError:
+            return None
@@ -0,0 +1,170 @@
+"""Persistent index of the music library"""
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from ..metrics import metrics
+from ..paths import get_data_dir
+from .tags import is_music_file, read_track_info
+from ..playlist.track_store import Track
+
+def walk_order(path):
+    """Sort key that puts paths in the order _walk() finds them: in each folder its files
+    first, then its subfolders, each by case-insensitive name"""
+    *folders, file_name = os.path.normpath(path).lower().split(os.sep)
+    # One string compares much faster than tuples: \x00 puts files before folders and ends names,
+    # so a name sorts before its longer variants as in a name sort
+    return ''.join(f"\x01{name}\x00" for name in folders) + "\x00" + file_name
+
+def _read_track_info_timed(full_path):
+    with metrics.span('library.tag_read'):
+        return read_track_info(full_path)
+
+class LibraryIndex:
+    """SQLite index of track tags, so reloading a folder only re-reads files whose size or mtime changed"""
+    TRACK_COLUMNS = "path, title, artist, album, duration, has_cover, loudness, true_peak"
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_data_dir(), 'library.sqlite3')
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    path TEXT PRIMARY KEY,
+                    folder TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    title TEXT,
+                    artist TEXT,
+                    album TEXT,
+                    duration REAL,
+                    has_cover INTEGER,
+                    loudness REAL,
+                    true_peak REAL
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS tracks_folder ON tracks (folder)")
+
+            # Indexes created before loudness analysis existed
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(tracks)")}
+            for column in ('loudness', 'true_peak'):
+                if column not in columns:
+                    self.connection.execute(f"ALTER TABLE tracks ADD COLUMN {column} REAL")
+
+    def get_folder(self, folder):
+        """Tracks known for this folder and its subfolders, straight from the index without touching the files"""
+        with self._lock:
+            rows = self._select_tree(self.TRACK_COLUMNS, folder)
+        # The order of a fresh scan; SQL collation would sort 'A B/' before 'A/' and differ from it
+        rows.sort(key=lambda row: walk_order(row[0]))
+        return [self._to_entry(row) for row in rows]
+
+    def scan_folder(self, folder, on_batch=None, workers=None, batch_size=200, cancel_event=None):
+        """Tracks for the music files in folder and its subfolders.
+
+        Tags are only read for new or changed files, on a pool of worker
+        threads. on_batch(entries, read_count) is called after every batch of
+        up to batch_size files, in folder order, so callers can show results
+        before the scan is over.
+        """
+        folder = os.path.normpath(folder)
+        with self._lock:
+            known = {row[0]: row for row in self._select_tree(self.TRACK_COLUMNS + ", size, mtime_ns", folder)}
+
+        entries = []
+        files = self._walk(folder)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = list(islice(files, batch_size))
+                if not batch or (cancel_event is not None and cancel_event.is_set()):
+                    break
+
+                rows = []
+                changed = []
+                for full_path, stat in batch:
+                    row = known.pop(full_path, None)
+                    if row is None or row[8] != stat.st_size or row[9] != stat.st_mtime_ns:
+                        row = None
+                        changed.append((len(rows), full_path, stat))
+                    rows.append(row)
+
+                # Read the tags of new or changed files in parallel
+                infos = pool.map(_read_track_info_timed, [full_path for _, full_path, _ in changed])
+                for (position, full_path, stat), info in zip(changed, infos):
+                    # A changed file needs its loudness measured again
+                    rows[position] = (full_path, info['title'], info['artist'], info['album'],
+                                      info['duration'], int(info['has_cover']), None, None,
+                                      stat.st_size, stat.st_mtime_ns)
+
+                self._store([rows[position] for position, _, _ in changed])
+                batch_entries = [self._to_entry(row) for row in rows]
+                entries.extend(batch_entries)
+                if on_batch:
+                    on_batch(batch_entries, len(changed))
+
+        # Files that are gone from the folder, unless the scan was cut short
+        if cancel_event is None or not cancel_event.is_set():
+            with self._lock, self.connection:
+                self.connection.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in known])
+
+        return entries
+
+    def store_loudness(self, results):
+        """Save (path, loudness, true peak) measurements; failed ones (peak None) are retried next time"""
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "UPDATE tracks SET loudness = ?, true_peak = ? WHERE path = ?",
+                [(loudness, true_peak, path) for path, loudness, true_peak in results if true_peak is not None])
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def _select_tree(self, columns, folder, order=""):
+        folder = os.path.normpath(folder)
+        prefix = os.path.join(folder, '')
+        return self.connection.execute(
+            f"SELECT {columns} FROM tracks WHERE folder = ? OR substr(folder, 1, ?) = ? {order}",
+            (folder, len(prefix), prefix)).fetchall()
+
+    def _store(self, rows):
+        if not rows:
+            return
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tracks (path, title, artist, album, duration, has_cover, loudness, true_peak, "
+                "size, mtime_ns, folder) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row + (os.path.dirname(row[0]),) for row in rows])
+
+    def _walk(self, folder):
+        """Yields (path, stat) of the music files under folder: files first, then subfolders, in name order.
+
+        get_folder() sorts the index with walk_order() to match.
+        """
+        try:
+            items = sorted(os.scandir(folder), key=lambda item: item.name.lower())
+        except OSError as e:
+            print(f"Could not read folder {folder}: {e}")
+            return
+
+        subfolders = []
+        for item in items:
+            try:
+                if item.is_dir(follow_symlinks=False):
+                    subfolders.append(item.path)
+                elif item.is_file() and is_music_file(item.name):
+                    yield os.path.normpath(item.path), item.stat()
+            except OSError:
+                continue
+
+        for subfolder in subfolders:
+            yield from self._walk(subfolder)
+
+    @staticmethod
+    def _to_entry(row):
+        """Index row to a playlist Track"""
+        return Track(row[0], artist=row[2], album=row[3], title=row[1], duration=row[4], has_cover=bool(row[5]),
+                     loudness=row[6], true_peak=row[7])
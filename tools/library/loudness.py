@@ -0,0 +1,172 @@
+"""Loudness measurement (ITU-R BS.1770 integrated loudness and true peak) for ReplayGain-style normalization"""
+import numpy as np
+from scipy import signal
+
+from ..equalizer.decoders import PcmDecoder, native_format
+from ..equalizer.wav_reader import WavReader
+
+REFERENCE_LOUDNESS = -18.0  # LUFS, the ReplayGain 2.0 target
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the ungated loudness
+SILENCE_PEAK = -120.0  # dBTP stored for digital silence
+OVERSAMPLING = 4  # for the true peak, as BS.1770 suggests
+PEAK_CONTEXT = 16  # frames on each side of a sample that the oversampling filter reaches (10 with the default window)
+
+def k_weighting(sample_rate):
+    """The BS.1770 K-weighting filter (head shelf, then RLB high-pass) as second-order sections.
+
+    Uses the analog prototypes of the published 48 kHz coefficients, so any
+    sample rate gets the same response.
+    """
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    k = np.tan(np.pi * 38.13547087613982 / sample_rate)
+    q = 0.5003270373253953
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return np.array([shelf, highpass])
+
+class LoudnessMeter:
+    """Accumulates a track block by block and reports its integrated loudness and true peak.
+
+    Only the K-weighted energy of each 100 ms step is kept, so memory use is
+    tiny whatever the length of the track. The oversampling for the true peak
+    carries the end of each block over to the next one, so block edges read
+    the same as the middle of a block.
+    """
+    def __init__(self, sample_rate, channels):
+        self.sos = k_weighting(sample_rate)
+        self.state = np.zeros((self.sos.shape[0], 2, channels))
+        self.step_frames = int(round(sample_rate * 0.1))
+        self.steps = []  # (n, channels) arrays of energy per 100 ms step
+        self.partial = np.zeros(channels)
+        self.partial_frames = 0
+        self.peak = 0.0
+        self.peak_history = np.zeros((2 * PEAK_CONTEXT, channels), dtype=np.float32)
+
+    def add(self, block):
+        """Feed a (frames, channels) float block in the range -1 to 1"""
+        if not len(block):
+            return
+
+        buffer = np.concatenate((self.peak_history, block))
+        self._measure_peak(buffer)
+        self.peak_history = buffer[-2 * PEAK_CONTEXT:]
+
+        weighted, self.state = signal.sosfilt(self.sos, block, axis=0, zi=self.state)
+        energy = np.square(weighted, dtype=np.float64)
+
+        # Complete the step left over from the previous block
+        take = min(self.step_frames - self.partial_frames, len(energy))
+        self.partial += energy[:take].sum(axis=0)
+        self.partial_frames += take
+        if self.partial_frames == self.step_frames:
+            self.steps.append(self.partial[None, :])
+            self.partial = np.zeros_like(self.partial)
+            self.partial_frames = 0
+
+        rest = energy[take:]
+        whole = len(rest) - len(rest) % self.step_frames
+        if whole:
+            self.steps.append(rest[:whole].reshape((-1, self.step_frames, rest.shape[1])).sum(axis=1))
+        if whole < len(rest):
+            self.partial += rest[whole:].sum(axis=0)
+            self.partial_frames += len(rest) - whole
+
+    def _measure_peak(self, buffer):
+        """Oversampled peak of buffer, leaving out its first and last PEAK_CONTEXT frames.
+
+        Their filter taps reach outside the buffer, so the first ones were
+        measured with the previous buffer and the last ones are measured with
+        the next.
+        """
+        upsampled = signal.resample_poly(buffer, OVERSAMPLING, 1, axis=0)
+        inner = upsampled[OVERSAMPLING * PEAK_CONTEXT:OVERSAMPLING * (len(buffer) - PEAK_CONTEXT)]
+        if len(inner):
+            self.peak = max(self.peak, float(np.abs(inner).max()))
+
+    def result(self):
+        """(integrated loudness in LUFS or None if too short or silent, true peak in dBTP)"""
+        # The end of the track, as if silence followed it
+        self._measure_peak(np.concatenate((self.peak_history, np.zeros_like(self.peak_history))))
+        true_peak = 20 * np.log10(self.peak) if self.peak > 0 else SILENCE_PEAK
+        true_peak = max(float(true_peak), SILENCE_PEAK)
+        if not self.steps:
+            return None, true_peak
+
+        # 400 ms gating blocks with 75% overlap, i.e. every 4 consecutive steps
+        steps = np.concatenate(self.steps)
+        if len(steps) < 4:
+            return None, true_peak
+        totals = np.cumsum(np.vstack([np.zeros((1, steps.shape[1])), steps]), axis=0)
+        blocks = (totals[4:] - totals[:-4]) / (4 * self.step_frames)
+
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(blocks.sum(axis=1))
+            gated = blocks[block_loudness > ABSOLUTE_GATE]
+            if not len(gated):
+                return None, true_peak
+            relative_gate = -0.691 + 10 * np.log10(gated.mean(axis=0).sum()) + RELATIVE_GATE
+            gated = blocks[(block_loudness > ABSOLUTE_GATE) & (block_loudness > relative_gate)]
+            loudness = -0.691 + 10 * np.log10(gated.mean(axis=0).sum())
+
+        return round(float(loudness), 2), round(true_peak, 2)
+
+def measure_file(input_file, block_frames=65536):
+    """(input_file, loudness, true peak) of a music file; loudness and peak are None if it can't be decoded.
+
+    Runs in pool worker processes, so it only takes and returns plain values.
+    """
+    try:
+        try:
+            reader = WavReader(input_file) if input_file.lower().endswith('.wav') else None
+        except ValueError:
+            reader = None
+
+        if reader is not None:
+            meter = LoudnessMeter(reader.sample_rate, reader.channels)
+            blocks = reader.blocks(block_frames)
+        else:
+            # Streamed from ffmpeg at the file's own rate, one block at a time
+            sample_rate, channels = native_format(input_file)
+            meter = LoudnessMeter(sample_rate, channels)
+            blocks = PcmDecoder(input_file, sample_rate, channels, block_frames)
+
+        frames = 0
+        for block in blocks:
+            meter.add(block)
+            frames += len(block)
+        if not frames:
+            raise ValueError("no audio decoded")
+        return (input_file,) + meter.result()
+    except Exception as e:
+        print(f"Could not measure the loudness of {input_file}: {e}")
+        return input_file, None, None
+
+def track_gain(loudness, true_peak, reference=REFERENCE_LOUDNESS):
+    """Linear gain that brings a track to the reference loudness without pushing its true peak over 0 dBTP"""
+    if loudness is None or true_peak is None:
+        return 1.0
+    return 10 ** (min(reference - loudness, -true_peak) / 20)
+
+def album_loudness(tracks):
+    """(loudness, true peak) of a group of measured tracks, as if played back to back.
+
+    Track loudness values are averaged in the power domain, weighted by
+    duration, which is close to measuring the album as one stream.
+    """
+    measured = [item for item in tracks if item.loudness is not None]
+    if not measured:
+        return None, None
+
+    weights = np.array([item.duration or 1.0 for item in measured])
+    powers = 10 ** (np.array([item.loudness for item in measured]) / 10)
+    loudness = 10 * np.log10((weights * powers).sum() / weights.sum())
+    return float(loudness), max(item.true_peak for item in measured)
@@ -0,0 +1,265 @@
+"""MP3 frame index, for fast and exact seeking in long files"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+from ..metrics import metrics
+from ..paths import file_key, get_data_dir
+
+# kbps by bitrate index, for (MPEG-1, layer) and (MPEG-2/2.5, layer); layer 3 is Layer I
+BITRATES = {
+    (True, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Hz by sample rate index, for each version id (0 is MPEG-2.5, 2 MPEG-2, 3 MPEG-1)
+SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+DECODER_DELAY = 529  # samples added by every MP3 decoder, trimmed along with the encoder delay of a LAME tag
+
+CACHE_MAGIC = b'SMFI'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<4sHIIIB')
+
+def parse_header(data, position):
+    """(sample rate, samples per frame, frame length in bytes, side info length) of the frame header
+    at position, or None if there is no valid header there"""
+    if position + 4 > len(data):
+        return None
+    header = int.from_bytes(data[position:position + 4], 'big')
+    version = (header >> 19) & 3
+    layer = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    if header >> 21 != 0x7FF or version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        # Free-format streams (bitrate index 0) have no length in the header and are not supported
+        return None
+
+    mpeg1 = version == 3
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    padding = (header >> 9) & 1
+    mono = (header >> 6) & 3 == 3
+    if layer == 3:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return sample_rate, samples, length, side_info
+
+class Mp3FrameIndex:
+    """Byte offset of every audio frame of an MP3 file, read from the frame headers only.
+
+    Decoders started on a frame boundary keep counting frames from there, so
+    audio frame k always plays at k * samples_per_frame - delay samples into
+    the track, the delay being what a full decode trims because of the LAME
+    tag. That makes the position after a seek exact.
+    """
+    def __init__(self, sample_rate, samples_per_frame, delay, offsets):
+        self.sample_rate = sample_rate
+        self.samples_per_frame = samples_per_frame
+        self.delay = delay
+        self.offsets = offsets
+
+    @property
+    def duration(self):
+        return max(len(self.offsets) * self.samples_per_frame - self.delay, 0) / self.sample_rate
+
+    def seek_point(self, seconds):
+        """(byte offset, position in seconds) of the frame that holds the given time"""
+        if not self.offsets:
+            raise ValueError("no audio frames")
+        frame = int((seconds * self.sample_rate + self.delay) // self.samples_per_frame)
+        frame = min(max(frame, 0), len(self.offsets) - 1)
+        position = max(frame * self.samples_per_frame - self.delay, 0) / self.sample_rate
+        return self.offsets[frame], position
+
+    @classmethod
+    def build(cls, input_file):
+        """Walk the frame headers of input_file; raises ValueError if it holds no MPEG audio"""
+        with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position = 0
+            if data[:3] == b'ID3':
+                size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+                position = 10 + size + (10 if data[5] & 0x10 else 0)
+
+            position = cls._sync(data, position)
+            if position is None:
+                raise ValueError(f"No MPEG audio frames in {input_file}")
+            sample_rate, samples_per_frame, length, side_info = parse_header(data, position)
+
+            # A Xing/Info (or VBRI) frame carries no audio; a LAME tag in it gives the encoder delay
+            delay = 0
+            xing = position + 4 + side_info
+            if data[xing:xing + 4] in (b'Xing', b'Info') or data[position + 36:position + 40] == b'VBRI':
+                delay = cls._lame_delay(data, xing)
+                position += length
+
+            offsets = array('I' if len(data) < 2**32 else 'Q')
+            while True:
+                header = parse_header(data, position)
+                if header is None or header[0] != sample_rate or position + header[2] > len(data):
+                    if data[position:position + 3] == b'TAG' or data[position:position + 8] == b'APETAGEX':
+                        break
+                    # A damaged stretch, or the end of the audio: look for the next frame
+                    position = cls._sync(data, position + 1, sample_rate)
+                    if position is None:
+                        break
+                    continue
+                offsets.append(position)
+                position += header[2]
+
+        return cls(sample_rate, samples_per_frame, delay, offsets)
+
+    @staticmethod
+    def _sync(data, position, sample_rate=None):
+        """Offset of the next frame header from position, confirmed by the header of the frame after it"""
+        while True:
+            position = data.find(b'\xff', position)
+            if position < 0 or position + 4 > len(data):
+                return None
+            header = parse_header(data, position)
+            if header is not None and (sample_rate is None or header[0] == sample_rate):
+                following = parse_header(data, position + header[2])
+                if (following is not None and following[0] == header[0]) or position + header[2] == len(data):
+                    return position
+            position += 1
+
+    @staticmethod
+    def _lame_delay(data, xing):
+        """Samples trimmed from the start by decoders, from the LAME tag after a Xing header"""
+        flags = int.from_bytes(data[xing + 4:xing + 8], 'big')
+        # Frame count, byte count, table of contents and quality fields, when present
+        tag = xing + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+        if data[tag:tag + 4] not in (b'LAME', b'Lavf', b'Lavc'):
+            return 0
+        return (data[tag + 21] << 4 | data[tag + 22] >> 4) + DECODER_DELAY
+
+    def save(self, file_path):
+        with open(file_path, 'wb') as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, self.sample_rate, self.samples_per_frame,
+                                      self.delay, self.offsets.itemsize))
+            self.offsets.tofile(f)
+
+    @classmethod
+    def load(cls, file_path):
+        """An index written by save(); raises ValueError if the file is not one"""
+        with open(file_path, 'rb') as f:
+            magic, version, sample_rate, samples_per_frame, delay, itemsize = CACHE_HEADER.unpack(
+                f.read(CACHE_HEADER.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                raise ValueError(f"Not a frame index: {file_path}")
+            offsets = array('I' if itemsize == array('I').itemsize else 'Q')
+            offsets.frombytes(f.read())
+        return cls(sample_rate, samples_per_frame, delay, offsets)
+
+class FileSlice:
+    """Read-only file object over a file from offset on, e.g. an MP3 stream starting at a frame boundary"""
+    def __init__(self, file_path, offset):
+        self.file = open(file_path, 'rb')
+        self.offset = offset
+        self.file.seek(offset)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            position += self.offset
+        return self.file.seek(position, whence) - self.offset
+
+    def tell(self):
+        return self.file.tell() - self.offset
+
+    def close(self):
+        self.file.close()
+
+class FrameIndexCache:
+    """Frame indexes kept in memory and on disk, keyed by the track's path, size and mtime.
+
+    An index is built once per file version, which reads the whole file the
+    first time; after that a seek costs one small cache read. Safe to use
+    from several threads: an index is loaded or built without holding the
+    cache lock, and other get()s for the same file wait for it while those
+    for other files go ahead.
+    """
+    def __init__(self, memory_items=8, cache_dir=None):
+        self.memory_items = memory_items
+        self.cache_dir = cache_dir or get_data_dir('frames')
+        self.indexes = OrderedDict()  # key -> Mp3FrameIndex
+        self._snapshot = {}  # copy of indexes, replaced whole on every change so peek() needs no lock
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> Event set once the index being loaded or built is in indexes
+
+    def get(self, track_path):
+        """Mp3FrameIndex of the file; raises OSError or ValueError if it can't be read"""
+        key = file_key(track_path)
+        while True:
+            with self._lock:
+                if key in self.indexes:
+                    self.indexes.move_to_end(key)
+                    return self.indexes[key]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Another thread is on this file; if it failed, try again here
+            loading.wait()
+
+        try:
+            index = self._load(track_path, key)
+            with self._lock:
+                self.indexes[key] = index
+                if len(self.indexes) > self.memory_items:
+                    self.indexes.popitem(last=False)
+                self._snapshot = dict(self.indexes)
+            return index
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def _load(self, track_path, key):
+        """The index from the disk cache, else built from the file and saved"""
+        cache_path = os.path.join(self.cache_dir, key + '.idx')
+        try:
+            return Mp3FrameIndex.load(cache_path)
+        except (OSError, ValueError, struct.error):
+            pass
+        with metrics.span('seek.frame_index_build'):
+            index = Mp3FrameIndex.build(track_path)
+        try:
+            index.save(cache_path)
+        except OSError as e:
+            print(f"Could not save the frame index of {track_path}: {e}")
+        return index
+
+    def peek(self, track_path):
+        """Mp3FrameIndex of the file if it is already in memory, else None.
+        Never reads the file nor waits for an index being built, so it is safe on the UI thread"""
+        try:
+            key = file_key(track_path)
+        except OSError:
+            return None
+        return self._snapshot.get(key)
+
+    def prepare(self, track_path):
+        """Build the index of an MP3 file in the background, so the first seek in it is instant"""
+        if track_path.lower().endswith('.mp3'):
+            threading.Thread(target=self._prepare, args=(track_path,), daemon=True).start()
+
+    def _prepare(self, track_path):
+        try:
+            self.get(track_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not index the frames of {track_path}: {e}")
+
+# Shared by the app and the stream player
+frame_indexes = FrameIndexCache()
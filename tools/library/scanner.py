@@ -0,0 +1,152 @@
+"""Background folder scanning and loudness analysis"""
+import multiprocessing
+import queue
+import threading
+import time
+
+from ..metrics import metrics
+
+class FolderScanner:
+    """Scans a folder tree with LibraryIndex on a background thread and hands the results over in batches.
+
+    The GUI thread calls poll() to collect messages, which are tuples:
+    ('batch', entries, scanned, elapsed) while scanning and
+    ('done', entries, scanned, elapsed) at the end.
+    """
+    def __init__(self, library, workers=None, batch_size=200):
+        self.library = library
+        self.workers = workers
+        self.batch_size = batch_size
+        self.folder = None
+        self._thread = None
+        self._queue = queue.Queue()
+        self._cancel_event = threading.Event()
+
+    @property
+    def busy(self):
+        """True while scanning or while results are waiting to be polled"""
+        return (self._thread is not None and self._thread.is_alive()) or not self._queue.empty()
+
+    def start(self, folder):
+        """Start scanning folder, cancelling any scan in progress"""
+        self.cancel()
+        self.folder = folder
+        self._queue = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(folder, self._queue, self._cancel_event), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def poll(self):
+        """Messages produced since the last call"""
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _run(self, folder, results, cancel_event):
+        started = time.perf_counter()
+        scanned = 0
+
+        def on_batch(entries, read_count):
+            nonlocal scanned
+            scanned += len(entries)
+            results.put(('batch', entries, scanned, time.perf_counter() - started))
+
+        try:
+            entries = self.library.scan_folder(folder, on_batch=on_batch, workers=self.workers,
+                                               batch_size=self.batch_size, cancel_event=cancel_event)
+        except Exception as e:
+            print(f"Error scanning {folder}: {e}")
+            entries = None
+
+        if not cancel_event.is_set():
+            metrics.record('library.scan', time.perf_counter() - started)
+            results.put(('done', entries, scanned, time.perf_counter() - started))
+
+class LoudnessScanner:
+    """Measures track loudness on a process pool and stores it in the LibraryIndex as results come in.
+
+    Results are saved every few tracks, so a scan that is cancelled or cut
+    short by quitting picks up where it stopped: the next start() only gets
+    the tracks that still have no measurement. poll() returns messages
+    ('batch', results, measured, total, elapsed) and, at the end,
+    ('done', [], measured, total, elapsed), where results are
+    (path, loudness, true peak) tuples.
+    """
+    def __init__(self, library, processes=None, batch_size=8):
+        self.library = library
+        self.processes = processes
+        self.batch_size = batch_size
+        self._thread = None
+        self._queue = queue.Queue()
+        self._cancel_event = threading.Event()
+
+    @property
+    def busy(self):
+        """True while measuring or while results are waiting to be polled"""
+        return (self._thread is not None and self._thread.is_alive()) or not self._queue.empty()
+
+    def start(self, paths):
+        """Measure the files in paths, cancelling any analysis in progress"""
+        self.cancel()
+        self._queue = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(list(paths), self._queue, self._cancel_event), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def poll(self):
+        """Messages produced since the last call"""
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _run(self, paths, results, cancel_event):
+        started = time.perf_counter()
+        measured = 0
+        pending = []
+
+        def flush():
+            nonlocal pending
+            if pending:
+                self.library.store_loudness(pending)
+                results.put(('batch', pending, measured, len(paths), time.perf_counter() - started))
+                pending = []
+
+        try:
+            # Imported here, as it loads NumPy and SciPy
+            from .loudness import measure_file
+
+            # Each worker decodes and measures whole files; only three numbers per track come back.
+            # Spawned rather than forked, as the GUI process has threads running
+            with multiprocessing.get_context('spawn').Pool(self.processes) as pool:
+                measurements = pool.imap_unordered(measure_file, paths)
+                while measured < len(paths):
+                    try:
+                        result = measurements.next(timeout=0.2)
+                    except multiprocessing.TimeoutError:
+                        if cancel_event.is_set():
+                            break
+                        continue
+                    measured += 1
+                    pending.append(result)
+                    if len(pending) >= self.batch_size:
+                        flush()
+                    if cancel_event.is_set():
+                        break
+            flush()
+        except Exception as e:
+            print(f"Error measuring loudness: {e}")
+
+        if not cancel_event.is_set():
+            results.put(('done', [], measured, len(paths), time.perf_counter() - started))
@@ -0,0 +1,43 @@
+"""Reads the tags and stream info of music files"""
+import os
+from mutagen.mp3 import MP3
+from mutagen.wave import WAVE
+
+SUPPORTED_EXTENSIONS = ('.mp3', '.wav')
+
+def is_music_file(file_name):
+    return file_name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+def read_track_info(full_path):
+    """Returns title, artist, album, duration (seconds) and cover presence of an MP3 or WAV file"""
+    info = {
+        'title': None,
+        'artist': "Unknown",
+        'album': "Unknown",
+        'duration': 0.0,
+        'has_cover': False
+    }
+
+    try:
+        if full_path.lower().endswith('.mp3'):
+            audio = MP3(full_path)
+        elif full_path.lower().endswith('.wav'):
+            audio = WAVE(full_path)
+        else:
+            return info
+
+        info['duration'] = audio.info.length
+
+        # Both formats keep their tags as ID3 frames
+        tags = audio.tags
+        if tags is not None:
+            for key, frame_id in (('title', 'TIT2'), ('artist', 'TPE1'), ('album', 'TALB')):
+                frame = tags.get(frame_id)
+                if frame is not None and frame.text:
+                    info[key] = str(frame.text[0])
+            info['has_cover'] = bool(tags.getall('APIC'))
+
+    except Exception as e:
+        print(f"Could not read tags of {os.path.basename(full_path)}: {e}")
+
+    return info
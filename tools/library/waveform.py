@@ -0,0 +1,158 @@
+"""Waveform overviews: the lowest and highest sample of each slice of a track"""
+import os
+import threading
+
+import numpy as np
+
+from mutagen import File as MutagenFile
+
+from ..equalizer.decoders import PcmDecoder, native_format
+from ..equalizer.wav_reader import WavReader
+from ..metrics import metrics
+from .mp3_frames import frame_indexes
+from ..paths import file_key, get_data_dir
+
+WAVEFORM_POINTS = 1000  # slices per track; views fold them down to their width
+
+class PeakAccumulator:
+    """Min/max of each of `points` equal slices of a track, fed block by block.
+
+    Each block is reduced with one reduceat() per side, so the cost is a few
+    passes over the samples in NumPy and memory use does not grow with the
+    length of the track. total_frames may be an estimate: frames past it go
+    to the last slice.
+    """
+    def __init__(self, total_frames, points=WAVEFORM_POINTS):
+        self.total_frames = max(total_frames, 1)
+        self.points = points
+        self.low = np.zeros(points, dtype=np.float32)
+        self.high = np.zeros(points, dtype=np.float32)
+        self.position = 0
+
+    def add(self, block):
+        """Feed a (frames, channels) float block in the range -1 to 1"""
+        frames = len(block)
+        if not frames:
+            return
+
+        # Slices touched by this block, and where each one starts in it; the first may have started before
+        first = min(self.position * self.points // self.total_frames, self.points - 1)
+        last = min((self.position + frames - 1) * self.points // self.total_frames, self.points - 1)
+        ids = np.arange(first, last + 1)
+        starts = -(-ids * self.total_frames // self.points) - self.position
+        starts[0] = 0
+        # Tracks shorter than `points` frames leave some slices empty
+        filled = np.diff(starts, append=frames) > 0
+        ids, starts = ids[filled], starts[filled]
+
+        self.low[ids] = np.minimum(self.low[ids], np.minimum.reduceat(block, starts).min(axis=1))
+        self.high[ids] = np.maximum(self.high[ids], np.maximum.reduceat(block, starts).max(axis=1))
+        self.position += frames
+
+    def result(self):
+        """(points, 2) int8 array of (low, high) per slice, scaled to -127..127"""
+        peaks = np.stack([self.low, self.high], axis=1)
+        return np.round(np.clip(peaks, -1.0, 1.0) * 127).astype(np.int8)
+
+def compute_peaks(input_file, points=WAVEFORM_POINTS, block_frames=65536):
+    """Peaks of a music file as returned by PeakAccumulator.result(); raises if it can't be decoded"""
+    try:
+        reader = WavReader(input_file) if input_file.lower().endswith('.wav') else None
+    except ValueError:
+        reader = None
+
+    if reader is not None:
+        accumulator = PeakAccumulator(reader.frames, points)
+        blocks = reader.blocks(block_frames)
+    else:
+        # Streamed from ffmpeg at the file's own rate, so memory use does not grow with the track
+        sample_rate, channels = native_format(input_file)
+        accumulator = PeakAccumulator(frame_count(input_file, sample_rate), points)
+        blocks = PcmDecoder(input_file, sample_rate, channels, block_frames)
+
+    for block in blocks:
+        accumulator.add(block)
+    if not accumulator.position:
+        raise ValueError(f"no audio decoded from {input_file}")
+    return accumulator.result()
+
+def frame_count(input_file, sample_rate):
+    """Length of a music file in frames: exact for MP3 from its frame index, else from its headers"""
+    if input_file.lower().endswith('.mp3'):
+        try:
+            return int(round(frame_indexes.get(input_file).duration * sample_rate))
+        except (OSError, ValueError) as e:
+            print(f"Could not index the frames of {input_file}: {e}")
+    try:
+        return int(MutagenFile(input_file).info.length * sample_rate)
+    except Exception as e:
+        raise ValueError(f"Unknown audio format: {input_file}") from e
+
+class WaveformCache:
+    """Peaks of tracks stored as small .npy files, keyed by the track's path, size and mtime.
+
+    A track is decoded for its waveform once per file version; after that
+    loading the overview costs one 2 KB read.
+    """
+    def __init__(self, points=WAVEFORM_POINTS, cache_dir=None):
+        self.points = points
+        self.cache_dir = cache_dir or get_data_dir('waveforms')
+
+    def get(self, track_path):
+        """Peaks of the track; raises OSError or ValueError (or a decoder error) if it can't be read"""
+        key = file_key(track_path, self.points)
+        cache_path = os.path.join(self.cache_dir, key + '.npy')
+        try:
+            peaks = np.load(cache_path, allow_pickle=False)
+            if peaks.shape == (self.points, 2):
+                return peaks
+        except (OSError, ValueError):
+            pass
+
+        with metrics.span('waveform.compute'):
+            peaks = compute_peaks(track_path, self.points)
+        try:
+            np.save(cache_path, peaks, allow_pickle=False)
+        except OSError as e:
+            print(f"Could not save the waveform of {track_path}: {e}")
+        return peaks
+
+class WaveformLoader:
+    """Loads overviews on one worker thread; only the latest request is served.
+
+    on_ready(track_path, peaks) is called from the worker thread, with None
+    for peaks if the track could not be read. Requests made while a track is
+    being decoded replace each other, so skipping through a playlist decodes
+    at most the track in progress and the last one picked.
+    """
+    def __init__(self, on_ready, cache=None):
+        self.on_ready = on_ready
+        self.cache = cache or WaveformCache()
+        self._request = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def request(self, track_path):
+        with self._condition:
+            self._request = track_path
+            self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                track_path, self._request = self._request, None
+
+            try:
+                peaks = self.cache.get(track_path)
+            except Exception as e:
+                print(f"Could not draw the waveform of {track_path}: {e}")
+                peaks = None
+            try:
+                self.on_ready(track_path, peaks)
+            except Exception as e:
+                print(f"Waveform callback failed: {e}")
@@ -0,0 +1,100 @@
+"""In-process timing metrics for the playback pipeline"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class MetricsRegistry:
+    """Collects named timing spans from any thread.
+
+    Each name keeps a count, total, min and max, plus the most recent
+    durations for percentiles. Spans can be timed with span() when they fit in
+    one block, or with begin()/end() when they start and finish in different
+    places, e.g. a click and the first block of audio reaching the mixer.
+    """
+    def __init__(self, recent=256):
+        self.recent = recent
+        self._stats = {}  # name -> [count, total, min, max, deque of recent durations]
+        self._open = {}  # name -> perf_counter() at begin()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block under name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def begin(self, name):
+        """Start a span that end() will close, replacing one still open under the same name"""
+        with self._lock:
+            self._open[name] = time.perf_counter()
+
+    def end(self, name):
+        """Close the span opened by begin(); does nothing if none is open"""
+        with self._lock:
+            started = self._open.pop(name, None)
+        if started is not None:
+            self.record(name, time.perf_counter() - started)
+
+    def cancel(self, name):
+        """Drop an open span without recording it"""
+        with self._lock:
+            self._open.pop(name, None)
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0.0, seconds, seconds, deque(maxlen=self.recent)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+            stats[4].append(seconds)
+
+    def snapshot(self):
+        """Summary of every span in milliseconds, by name"""
+        with self._lock:
+            items = [(name, stats[:4], stats[4][-1], sorted(stats[4])) for name, stats in self._stats.items()]
+
+        summary = {}
+        for name, (count, total, shortest, longest), last, recent in sorted(items):
+            summary[name] = {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'mean_ms': round(total * 1000 / count, 3),
+                'min_ms': round(shortest * 1000, 3),
+                'max_ms': round(longest * 1000, 3),
+                'p50_ms': round(recent[len(recent) // 2] * 1000, 3),
+                'p95_ms': round(recent[min(len(recent) - 1, len(recent) * 95 // 100)] * 1000, 3),
+                'last_ms': round(last * 1000, 3),
+            }
+        return summary
+
+    def format(self):
+        """The snapshot as a plain text table"""
+        lines = [f"{'span':<28} {'count':>6} {'mean':>9} {'p95':>9} {'max':>9} {'last':>9}  (ms)"]
+        for name, stats in self.snapshot().items():
+            lines.append(f"{name:<28} {stats['count']:>6} {stats['mean_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+                         f"{stats['max_ms']:>9.1f} {stats['last_ms']:>9.1f}")
+        return "\n".join(lines)
+
+    def dump(self, file_path):
+        """Write the snapshot to a JSON file"""
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, indent=1)
+        except OSError as e:
+            print(f"Could not save metrics to {file_path}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self._open.clear()
+
+# Shared by the whole app
+metrics = MetricsRegistry()
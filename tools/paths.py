@@ -0,0 +1,24 @@
+"""Folders where Starfruit Music Player keeps its data between sessions, and keys for the files cached there"""
+import hashlib
+import os
+
+def get_data_dir(*parts):
+    """Returns the player's per-user cache folder (or a subfolder of it), creating it if needed"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    folder = os.path.join(base, 'StarfruitMusicPlayer', *parts)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def file_key(file_path, *extra):
+    """sha1 hex digest of the file's absolute path, size and mtime, plus any extra values; raises OSError.
+
+    A key changes whenever the file is replaced or edited, so caches keyed
+    by it never serve data of an older version of the file.
+    """
+    stat = os.stat(file_path)
+    identity = '|'.join([os.path.abspath(file_path), str(stat.st_size), str(stat.st_mtime_ns), *map(str, extra)])
+    return hashlib.sha1(identity.encode('utf-8', 'surrogateescape')).hexdigest()
@@ -0,0 +1 @@
+# Playlist module for Starfruit Music Player
@@ -0,0 +1,110 @@
+"""Playlist widget that only draws the rows on screen"""
+import tkinter as tk
+from tkinter import ttk
+
+class PlaylistView(tk.Frame):
+    """Virtualized playlist: a Text widget holding only the visible rows, plus a scrollbar.
+
+    The rows come from two callables, count() and label_for(index), so the
+    view never copies the playlist. Scrolling redraws at most `rows` lines and
+    moving the now-playing marker touches only two lines, whatever the
+    playlist size.
+    """
+    PLAYING_PREFIX = "▶️ "
+
+    def __init__(self, master, count, label_for, on_activate=None, rows=16, width=40, **text_options):
+        super().__init__(master, background=text_options.get('background'))
+        self.count = count
+        self.label_for = label_for
+        self.on_activate = on_activate
+        self.rows = rows
+        self.top = 0  # playlist index of the first visible row
+        self.playing_idx = None
+
+        self.text = tk.Text(self, height=rows, width=width, cursor="hand2", wrap="none", **text_options)
+        self.text.grid(row=0, column=0, sticky="nsew")
+        self.text.config(state="disabled")
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.text.tag_configure("bg_red", background="#f09696")
+        self.text.tag_configure("bg_darkred", background="#e27e7e")
+
+        self.text.bind("<MouseWheel>", self._on_mousewheel)
+        self.text.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.text.bind("<Button-5>", lambda event: self.scroll(3))
+        self.text.bind("<Button-1>", self._on_click)
+        # Keep Tk from scrolling or selecting inside the widget on its own
+        self.text.bind("<B1-Motion>", lambda event: "break")
+        self.text.bind("<Double-Button-1>", lambda event: "break")
+
+    def refresh(self):
+        """Redraw the visible rows, e.g. after the playlist changed"""
+        total = self.count()
+        self.top = max(0, min(self.top, total - self.rows))
+
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        for idx in range(self.top, min(self.top + self.rows, total)):
+            tag = "bg_red" if idx % 2 == 0 else "bg_darkred"
+            prefix = self.PLAYING_PREFIX if idx == self.playing_idx else ""
+            newline = "\n" if idx > self.top else ""
+            self.text.insert(tk.END, newline)
+            self.text.insert(tk.END, f"{prefix}{self.label_for(idx)}", tag)
+        self.text.config(state="disabled")
+
+        if total > 0:
+            self.scrollbar.set(self.top / total, min(self.top + self.rows, total) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def set_playing(self, idx):
+        """Move the now-playing marker, scrolling to it if it is off screen"""
+        previous = self.playing_idx
+        self.playing_idx = idx
+
+        if idx is not None and not self._is_visible(idx):
+            self.top = max(0, idx - self.rows // 2)
+            self.refresh()
+            return
+
+        self.text.config(state="normal")
+        if previous is not None and previous != idx and self._is_visible(previous):
+            line = previous - self.top + 1
+            self.text.delete(f"{line}.0", f"{line}.{len(self.PLAYING_PREFIX)}")
+        if idx is not None and idx != previous:
+            tag = "bg_red" if idx % 2 == 0 else "bg_darkred"
+            self.text.insert(f"{idx - self.top + 1}.0", self.PLAYING_PREFIX, tag)
+        self.text.config(state="disabled")
+
+    def scroll(self, delta):
+        """Scroll by delta rows"""
+        self.top += delta
+        self.refresh()
+        return "break"
+
+    def _is_visible(self, idx):
+        return self.top <= idx < min(self.top + self.rows, self.count())
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.top = int(float(value) * self.count())
+            self.refresh()
+        elif action == "scroll":
+            step = self.rows if unit == "pages" else 1
+            self.scroll(int(value) * step)
+
+    def _on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_click(self, event):
+        line = int(self.text.index(f"@{event.x},{event.y}").split(".")[0])
+        line_info = self.text.dlineinfo(f"{line}.0")
+        if line_info is None or event.y > line_info[1] + line_info[3]:
+            return "break"  # Below the last row
+
+        idx = self.top + line - 1
+        if self.on_activate and 0 <= idx < self.count():
+            self.on_activate(idx)
+        return "break"
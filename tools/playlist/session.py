@@ -0,0 +1,78 @@
+"""Snapshot of the player session, so a relaunch starts where the last one stopped"""
+import json
+import os
+
+from ..paths import get_data_dir
+from .track_store import Track
+
+SESSION_VERSION = 1
+
+class SessionStore:
+    """Saves and restores the playlist and the player state in the data folder.
+
+    The playlist goes to its own file and is only rewritten when the
+    TrackStore version changed, so the periodic saves of the position and
+    settings stay cheap with big playlists. Folder, artist and album names
+    are stored once in a string table. Loading never touches the audio files.
+    """
+    def __init__(self, folder=None):
+        folder = folder or get_data_dir('session')
+        self.playlist_path = os.path.join(folder, 'playlist.json')
+        self.state_path = os.path.join(folder, 'state.json')
+        self._saved_version = None
+
+    def load(self):
+        """(tracks, state) of the last session; an empty list and dict if there is none or it is unreadable"""
+        state = self._read(self.state_path)
+        playlist = self._read(self.playlist_path)
+        if state.get('version') != SESSION_VERSION or playlist.get('version') != SESSION_VERSION:
+            return [], {}
+
+        try:
+            strings = playlist['strings']
+            tracks = [Track.from_parts(strings[folder], file_name, strings[artist], strings[album],
+                                       title, duration, has_cover, loudness, true_peak)
+                      for folder, file_name, title, artist, album, duration, has_cover, loudness, true_peak
+                      in playlist['tracks']]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"Could not restore the last playlist: {e}")
+            return [], {}
+        return tracks, state
+
+    def save(self, playlist, state):
+        """Write the state, and the playlist too if it changed since the last save"""
+        if playlist.version != self._saved_version:
+            strings = {}
+            def string_id(text):
+                return strings.setdefault(text, len(strings))
+
+            tracks = [(string_id(item.folder), item.file_name, item.title, string_id(item.artist),
+                       string_id(item.album), item.duration, item.has_cover, item.loudness, item.true_peak)
+                      for item in playlist]
+            if not self._write(self.playlist_path, {'version': SESSION_VERSION, 'strings': list(strings), 'tracks': tracks}):
+                return
+            self._saved_version = playlist.version
+
+        self._write(self.state_path, dict(state, version=SESSION_VERSION))
+
+    @staticmethod
+    def _read(file_path):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write(file_path, data):
+        """Write through a temporary file, so a crash mid-save leaves the previous snapshot intact"""
+        try:
+            # One dumps() and write() is much faster than json.dump()'s many small writes
+            text = json.dumps(data, separators=(',', ':'))
+            with open(file_path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(file_path + '.tmp', file_path)
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save the session to {file_path}: {e}")
+            return False
@@ -0,0 +1,143 @@
+"""Shuffled play order over playlist indices"""
+import random
+
+class ShuffleOrder:
+    """A random play order over the indices 0..count-1, plus the history of what played.
+
+    The permutation is drawn lazily with a sparse Fisher-Yates shuffle: only
+    the swapped positions are stored, so turning shuffle on costs O(1)
+    whatever the playlist size, and each next track is O(1). Every track
+    plays once per round; a new round starts when all have played, never
+    with the track that just ended.
+
+    history holds the indices in the order they played (and the next one
+    once it has been picked), so previous() goes back to what actually
+    played, and next() after previous() walks forward through the same
+    tracks again. The playlist itself is never reordered.
+    """
+    HISTORY_LIMIT = 1000
+
+    def __init__(self, count, current=None):
+        self.count = count
+        self.history = []
+        self.position = -1  # index in history of the track playing now
+        self._values = {}  # position in the permutation -> playlist index, where it differs
+        self._positions = {}  # playlist index -> position in the permutation, where it differs
+        self._drawn = 0  # positions before this one have been drawn in this round
+        if current is not None and 0 <= current < count:
+            self.jump(current)
+
+    def peek_next(self):
+        """Index of the track that plays after the current one, picking it if needed; None if the playlist is empty"""
+        if self.position + 1 >= len(self.history):
+            if not self.count:
+                return None
+            self._append(self._draw_next())
+        return self.history[self.position + 1]
+
+    def next(self):
+        """Moves on to the next track and returns its index, or None if the playlist is empty"""
+        idx = self.peek_next()
+        if idx is not None:
+            self.position += 1
+        return idx
+
+    def previous(self):
+        """Moves back to the track played before and returns its index, or None at the start of the history"""
+        if self.position <= 0:
+            return None
+        self.position -= 1
+        return self.history[self.position]
+
+    def jump(self, idx):
+        """The user picked a track: it plays now and is not picked again in this round"""
+        del self.history[self.position + 1:]
+        self._take(idx)
+        self._append(idx)
+        self.position = len(self.history) - 1
+
+    def grow(self, count):
+        """Tracks were appended to the playlist; they join the tracks not played yet in this round"""
+        self.count = max(self.count, count)
+
+    def get_state(self):
+        """Plain values for saving the session"""
+        return {
+            'count': self.count,
+            'history': self.history,
+            'position': self.position,
+            'drawn': self._drawn,
+            'swaps': sorted(self._values.items()),
+        }
+
+    @classmethod
+    def from_state(cls, count, state):
+        """An order saved by get_state(); raises ValueError if it does not fit a playlist of count tracks"""
+        if state.get('count') != count:
+            raise ValueError("the playlist changed")
+        order = cls(count)
+        order.history = [int(idx) for idx in state['history']]
+        order.position = int(state['position'])
+        order._drawn = int(state['drawn'])
+        for position, idx in state['swaps']:
+            order._values[int(position)] = int(idx)
+            order._positions[int(idx)] = int(position)
+        if not all(0 <= idx < count for idx in order.history) or not -1 <= order.position < len(order.history):
+            raise ValueError("index out of range")
+        return order
+
+    def _draw_next(self):
+        if self._drawn < self.count:
+            return self._draw()
+
+        # New round. The track that just played is held back for the first pick, then returned to the pool
+        self._values.clear()
+        self._positions.clear()
+        self._drawn = 0
+        last = self.history[-1] if self.history else None
+        if last is None or self.count < 2 or last >= self.count:
+            return self._draw()
+        self._take(last)
+        idx = self._draw()
+        self._swap(0, 1)
+        self._drawn = 1
+        return idx
+
+    def _take(self, idx):
+        """Count idx as drawn in this round"""
+        position = self._position(idx)
+        if position >= self._drawn:
+            self._swap(position, self._drawn)
+            self._drawn += 1
+
+    def _draw(self):
+        position = self._drawn
+        self._swap(position, random.randrange(position, self.count))
+        self._drawn += 1
+        return self._value(position)
+
+    def _append(self, idx):
+        self.history.append(idx)
+        if len(self.history) > self.HISTORY_LIMIT:
+            del self.history[0]
+            self.position -= 1
+
+    def _value(self, position):
+        return self._values.get(position, position)
+
+    def _position(self, idx):
+        return self._positions.get(idx, idx)
+
+    def _swap(self, first, second):
+        first_value, second_value = self._value(first), self._value(second)
+        self._set(first, second_value)
+        self._set(second, first_value)
+
+    def _set(self, position, idx):
+        # Positions holding their own index are left out, which keeps both maps sparse
+        if position == idx:
+            self._values.pop(position, None)
+            self._positions.pop(idx, None)
+        else:
+            self._values[position] = idx
+            self._positions[idx] = position
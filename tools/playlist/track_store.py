@@ -0,0 +1,95 @@
+"""Compact storage for playlist tracks"""
+import os
+import sys
+
+class Track:
+    """One playlist track.
+
+    Slotted, and the folder, artist and album strings are interned, so a
+    track from a big folder costs little more than its file name.
+    """
+    __slots__ = ('folder', 'file_name', 'artist', 'album', 'title', 'duration', 'has_cover', 'loudness', 'true_peak')
+
+    def __init__(self, path, artist="Unknown", album="Unknown", title=None, duration=None, has_cover=None,
+                 loudness=None, true_peak=None):
+        folder, file_name = os.path.split(path)
+        self.folder = sys.intern(folder)
+        self.file_name = file_name
+        self.artist = sys.intern(artist)
+        self.album = sys.intern(album)
+        self.title = title
+        self.duration = duration  # seconds, None until known
+        self.has_cover = has_cover  # None until known
+        self.loudness = loudness  # integrated loudness in LUFS, None until measured or if silent
+        self.true_peak = true_peak  # dBTP, None until measured
+
+    @classmethod
+    def from_parts(cls, folder, file_name, artist="Unknown", album="Unknown", title=None, duration=None,
+                   has_cover=None, loudness=None, true_peak=None):
+        """Same as Track(os.path.join(folder, file_name), ...), without joining and splitting the path again"""
+        track = cls.__new__(cls)
+        track.folder = sys.intern(folder)
+        track.file_name = file_name
+        track.artist = sys.intern(artist)
+        track.album = sys.intern(album)
+        track.title = title
+        track.duration = duration
+        track.has_cover = has_cover
+        track.loudness = loudness
+        track.true_peak = true_peak
+        return track
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, self.file_name)
+
+    @property
+    def name(self):
+        """File name without extension, as shown in the playlist"""
+        return os.path.splitext(self.file_name)[0]
+
+    def __repr__(self):
+        return f"Track({self.path!r})"
+
+class TrackStore:
+    """The playlist: an ordered list of Track records with a small list-like API.
+
+    version goes up on every change to the list, so savers can tell cheaply
+    whether there is anything new to write.
+    """
+    def __init__(self, tracks=()):
+        self._tracks = list(tracks)
+        self.version = 0
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __bool__(self):
+        return bool(self._tracks)
+
+    def __getitem__(self, idx):
+        return self._tracks[idx]
+
+    def __setitem__(self, idx, track):
+        self._tracks[idx] = track
+        self.version += 1
+
+    def __iter__(self):
+        return iter(self._tracks)
+
+    def append(self, track):
+        self._tracks.append(track)
+        self.version += 1
+
+    def extend(self, tracks):
+        self._tracks.extend(tracks)
+        self.version += 1
+
+    def replace(self, tracks):
+        """Swap the whole contents, e.g. after a rescan"""
+        self._tracks = list(tracks)
+        self.version += 1
+
+    def clear(self):
+        self._tracks.clear()
+        self.version += 1
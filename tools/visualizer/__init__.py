@@ -0,0 +1 @@
+# Visualizer module for Starfruit Music Player
@@ -0,0 +1,130 @@
+"""Live spectrum of the samples being played"""
+import time
+import tkinter as tk
+
+import numpy as np
+
+from ..metrics import metrics
+
+class SpectrumAnalyzer:
+    """Levels of log-spaced frequency bands, from a Hann-windowed FFT of the latest samples.
+
+    Levels go from 0 (floor dB and below) to 1 (full scale) and fall back at
+    `fall` per second, like the bars of a hardware meter.
+    """
+    def __init__(self, sample_rate, bands=24, fft_size=2048, low=50.0, high=16000.0, floor=-60.0, fall=1.5):
+        self.fft_size = fft_size
+        self.floor = floor
+        self.fall = fall
+        self.window = np.hanning(fft_size).astype(np.float32)
+        # A full scale sine reads 0 dB
+        self.scale = 2 / float(self.window.sum())
+
+        frequencies = np.fft.rfftfreq(fft_size, 1 / sample_rate)
+        high = min(high, sample_rate / 2)
+        starts = np.searchsorted(frequencies, np.geomspace(low, high, bands + 1)[:-1])
+        # The lowest bands are narrower than one FFT bin; give each at least one
+        for idx in range(1, bands):
+            starts[idx] = max(starts[idx], starts[idx - 1] + 1)
+        self.starts = starts
+        self.end = max(int(np.searchsorted(frequencies, high)), starts[-1] + 1)
+        self.levels = np.zeros(bands, dtype=np.float32)
+
+    def update(self, frames, elapsed):
+        """Levels after elapsed seconds, given the latest (frames, channels) samples or None for silence"""
+        target = 0.0
+        if frames is not None and len(frames):
+            mono = frames.mean(axis=1) if frames.ndim == 2 else frames
+            mono = mono[-self.fft_size:]
+            if len(mono) < self.fft_size:
+                mono = np.concatenate((np.zeros(self.fft_size - len(mono), dtype=np.float32), mono))
+            magnitudes = np.abs(np.fft.rfft(mono * self.window)) * self.scale
+            bands = np.maximum.reduceat(magnitudes[:self.end], self.starts)
+            decibels = 20 * np.log10(np.maximum(bands, 1e-6))
+            target = np.clip(1 - decibels / self.floor, 0.0, 1.0)
+        self.levels = np.maximum(target, self.levels - self.fall * elapsed).astype(np.float32)
+        return self.levels
+
+    def reset(self):
+        self.levels[:] = 0
+
+class SpectrumView(tk.Canvas):
+    """Bar display of spectrum levels. The bars are created once; a redraw only moves the ones that changed"""
+    def __init__(self, master, bands=24, width=200, height=40, color="#e58015", background="#321316", **options):
+        super().__init__(master, width=width, height=height, background=background,
+                         highlightthickness=0, borderwidth=0, **options)
+        self.bands = bands
+        self.height = height
+        self.bar_width = width / bands
+        self.heights = [0] * bands
+        self.bars = [self.create_rectangle(idx * self.bar_width + 1, height, (idx + 1) * self.bar_width - 1, height,
+                                           fill=color, width=0)
+                     for idx in range(bands)]
+
+    def draw(self, levels):
+        for idx, level in enumerate(levels):
+            bar_height = int(level * self.height)
+            if bar_height != self.heights[idx]:
+                self.heights[idx] = bar_height
+                x = idx * self.bar_width
+                self.coords(self.bars[idx], x + 1, self.height - bar_height, x + self.bar_width - 1, self.height)
+
+class SpectrumDisplay:
+    """Runs a SpectrumAnalyzer into a SpectrumView on a Tk timer, within a CPU budget.
+
+    Each frame (reading the samples, the FFT and moving the bars) is timed.
+    The interval is set so the average frame takes at most `budget` of one
+    core: interval on a fast machine, up to max_interval on a slow one.
+    Like the scroll ticker, it stops while the window is hidden until
+    start() is called again.
+    """
+    def __init__(self, view, read_frames, sample_rate, budget=0.02, interval=40, max_interval=250):
+        self.view = view
+        self.read_frames = read_frames  # read_frames(count) -> the latest float frames, or None
+        self.analyzer = SpectrumAnalyzer(sample_rate, bands=view.bands)
+        self.budget = budget
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.interval = interval
+        self.frame_cost = 0.0  # seconds, moving average
+        self.job = None
+        self._last_frame = None
+
+    @property
+    def load(self):
+        """Measured share of one core taken by the display at its current rate"""
+        return self.frame_cost * 1000 / self.interval
+
+    def start(self):
+        if self.job is None:
+            self._last_frame = time.perf_counter()
+            self.job = self.view.after(self.interval, self._tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.view.after_cancel(self.job)
+            self.job = None
+        self.analyzer.reset()
+        self.view.draw(self.analyzer.levels)
+
+    def _tick(self):
+        self.job = None
+        if not self.view.winfo_viewable():
+            return
+
+        started = time.perf_counter()
+        frames = self.read_frames(self.analyzer.fft_size)
+        levels = self.analyzer.update(frames, started - self._last_frame)
+        self.view.draw(levels)
+        self._last_frame = started
+        cost = time.perf_counter() - started
+        metrics.record('ui.spectrum_frame', cost)
+
+        self.frame_cost = cost if not self.frame_cost else self.frame_cost * 0.9 + cost * 0.1
+        if frames is None and not levels.any():
+            # Nothing playing and the bars are down: just check back now and then
+            self.interval = self.max_interval
+        else:
+            wanted = self.frame_cost / self.budget * 1000
+            self.interval = int(min(max(wanted, self.min_interval), self.max_interval))
+        self.job = self.view.after(self.interval, self._tick)
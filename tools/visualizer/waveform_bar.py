@@ -0,0 +1,54 @@
+"""Seek bar drawn as the waveform of the song"""
+import tkinter as tk
+
+class WaveformBar(tk.Canvas):
+    """Progress and seek bar showing the waveform overview of the track.
+
+    Every pixel column is one line item, created when the peaks change.
+    Moving the playhead only recolours the columns it passed, which is one
+    or two items per position update. Without peaks it draws a flat bar, so
+    it still works as a plain progress bar while the overview loads.
+    """
+    def __init__(self, master, width=200, height=32, played="#e58015", unplayed="#7a3a3f",
+                 background="#321316", **options):
+        super().__init__(master, width=width, height=height, background=background,
+                         highlightthickness=0, borderwidth=0, **options)
+        self.width = width
+        self.height = height
+        self.played = played
+        self.unplayed = unplayed
+        self.columns = []  # line item of each pixel column
+        self.played_columns = 0
+        self.set_peaks(None)
+
+    def set_peaks(self, peaks):
+        """Draw a new overview. peaks is a sequence of (low, high) pairs from -127 to 127, or None for a flat bar"""
+        self.delete("all")
+        self.columns = []
+        middle = self.height / 2
+        scale = (middle - 1) / 127
+        count = len(peaks) if peaks is not None else 0
+
+        for x in range(self.width):
+            if count:
+                # Fold the slices that fall on this column
+                first = x * count // self.width
+                part = peaks[first:max((x + 1) * count // self.width, first + 1)]
+                low = min(pair[0] for pair in part)
+                high = max(pair[1] for pair in part)
+                top, bottom = middle - high * scale, middle - low * scale + 1
+            else:
+                top, bottom = middle - 2, middle + 2
+            color = self.played if x < self.played_columns else self.unplayed
+            self.columns.append(self.create_line(x, top, x, bottom, fill=color))
+
+    def set_progress(self, fraction):
+        """Move the playhead to fraction (0 to 1) of the track"""
+        played = int(min(max(fraction, 0.0), 1.0) * self.width)
+        if played > self.played_columns:
+            for item in self.columns[self.played_columns:played]:
+                self.itemconfigure(item, fill=self.played)
+        elif played < self.played_columns:
+            for item in self.columns[played:self.played_columns]:
+                self.itemconfigure(item, fill=self.unplayed)
+        self.played_columns = played